@@ -90,6 +90,9 @@ class FishingDerbyMinimaxApp(FishingDerbyApp, Fishes, PrintScore2Players, GamesW
         msg = {}
         for name, fish in self.fishes.items():
             msg[name] = {"type": fish.type_fish, "score": fish.score}
+        if self.settings.compact_observations:
+            # The whole sequences are sent once, the next messages only carry the current step
+            msg["observations"] = {int(name[4:]): fish.observations_sequence for name, fish in self.fishes.items()}
         msg["game_over"] = False
         self.sender(msg)
 
@@ -122,7 +125,8 @@ class FishingDerbyMinimaxApp(FishingDerbyApp, Fishes, PrintScore2Players, GamesW
         # Calculate fishes next move
         self.fishes_next_move()
 
-    def build_minimax_msg(self, msg):
+    def build_minimax_msg(self, msg, compact=False):
+        """Describe the game state. Compact messages carry the current step instead of the remaining observations"""
         msg["hooks_positions"] = {}
         msg["fishes_positions"] = {}
         msg["observations"] = {}
@@ -137,7 +141,10 @@ class FishingDerbyMinimaxApp(FishingDerbyApp, Fishes, PrintScore2Players, GamesW
             n = int(k[4:])
             msg["fishes_positions"][n] = (fish.position.x, fish.position.y)
             st = fish.updates_cnt
-            msg["observations"][n] = fish.observations_sequence[st:]
+            if compact:
+                msg["step"] = st
+            else:
+                msg["observations"][n] = fish.observations_sequence[st:]
             msg["fish_scores"][n] = fish.score
 
         caught_fish_names = {0: None,
@@ -156,8 +163,11 @@ class FishingDerbyMinimaxApp(FishingDerbyApp, Fishes, PrintScore2Players, GamesW
         return msg
 
     def update_specific(self, msg):
-        msg = self.build_minimax_msg(msg)
+        # The opponent builds its tree from a full message
+        msg = self.build_minimax_msg(msg, compact=self.current_player == 0 and self.settings.compact_observations)
         if self.current_player == 0:
+            # Lets the player measure the latency of the pipe
+            msg["time_sent"] = time()
             self.sender(msg)
             self.time_sent = time()
         else:
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+from fishing_game_core.game_tree import Node
+from fishing_game_core.headless import HeadlessFishingDerby, LocalOpponent, STR_TO_ACTION
+from player import PlayerControllerMinimax
+
+# Depth of the deterministic search used by player 0 to reach the benchmark positions
+POSITIONS_SEARCH_DEPTH = 2
+
+
+def collect_positions(filename, n_positions, interval, seed=0):
+    """
+    Play a deterministic headless game and keep some of the positions where player 0 has to move
+    :param filename: observations file of the scenario
+    :param n_positions: maximum number of positions to keep
+    :param interval: number of moves of player 0 between two kept positions
+    :param seed: seed of the opponent
+    :return: list of (step, message) tuples
+    """
+    game = HeadlessFishingDerby.from_file(filename)
+    player_controller = PlayerControllerMinimax()
+    opponent = LocalOpponent(seed=seed)
+
+    positions = []
+    n_moves = 0
+    state = game.advance(game.initial_state(), 0, 0)
+    step = 1
+    while step < game.n_seq and len(positions) < n_positions and any(p is not None for p in state.fish):
+        msg = game.build_message(state, step)
+        node = Node(message=msg, player=state.player)
+        if state.player == 0:
+            if n_moves % interval == 0:
+                positions.append((step, msg))
+            n_moves += 1
+            act = player_controller.iterative_deepening_search(node, float("inf"), max_depth=POSITIONS_SEARCH_DEPTH)
+        else:
+            act = STR_TO_ACTION[opponent.next_move(node)]
+        if state.caught[state.player] != -1:
+            act = 1
+        state = node.compute_next_state(node.state, act, node.observations[0])
+        step += 1
+    return positions
+
+
+def measure(msg, depth=None):
+    """
+    Search a position with a fresh player
+    :param msg: message describing the position, player 0 to move
+    :param depth: search exactly this depth without time limit, or None to search within the usual time limit
+    :return: dict with the metrics of the search
+    """
+    player_controller = PlayerControllerMinimax()
+    table = player_controller.transposition_table
+    node = Node(message=msg, player=0)
+    start = time.perf_counter()
+    if depth is None:
+        player_controller.search_best_next_move(initial_tree_node=node)
+    else:
+        player_controller.iterative_deepening_search(node, float("inf"), max_depth=depth)
+    elapsed = time.perf_counter() - start
+
+    statistics = player_controller.statistics
+    return {"depth": player_controller.search_depth,
+            "nodes": statistics["nodes"],
+            "time": elapsed,
+            "nodes_per_second": statistics["nodes"] / elapsed,
+            "tt_hit_rate": table.hits / table.probes if table.probes else 0.0,
+            "cutoff_ratio": statistics["cutoffs"] / statistics["interior_nodes"] if statistics["interior_nodes"] else 0.0}
+
+
+def summarize(results):
+    """
+    Average the metrics over the positions that were searched. The positions answered without a search, by the
+    endgame solver or because only one move is legal, have no nodes and are left out.
+    :param results: dict position name -> metrics
+    :return: dict with the mean of every metric
+    """
+    keys = ["depth", "nodes", "time", "nodes_per_second", "tt_hit_rate", "cutoff_ratio"]
+    searched = [result for result in results.values() if result["nodes"] > 0]
+    return {key: sum(result[key] for result in searched) / max(len(searched), 1) for key in keys}
+
+
+def find_regressions(summary, baseline, depth, tolerance):
+    """
+    Compare a summary against the saved baseline
+    :param summary: summary of the current run
+    :param baseline: summary of the baseline run, made with the same mode
+    :param depth: fixed depth of the run or None for timed runs
+    :param tolerance: relative change accepted before reporting a regression
+    :return: list of messages describing the regressions
+    """
+    regressions = []
+    if depth is None:
+        if summary["depth"] < baseline["depth"] - 0.5:
+            regressions.append(f"mean depth {summary['depth']:.2f} < baseline {baseline['depth']:.2f}")
+    elif summary["nodes"] > baseline["nodes"] * (1 + tolerance):
+        regressions.append(f"mean nodes {summary['nodes']:.0f} > baseline {baseline['nodes']:.0f}")
+    if summary["nodes_per_second"] < baseline["nodes_per_second"] * (1 - tolerance):
+        regressions.append(f"nodes per second {summary['nodes_per_second']:.0f} < "
+                           f"baseline {baseline['nodes_per_second']:.0f}")
+    return regressions
+
+
+if __name__ == '__main__':
+    # Arguments parsing
+    arguments_parser = argparse.ArgumentParser(
+        description="Benchmark the minimax search on fixed positions of the observation files")
+    arguments_parser.add_argument("--observations", type=str, default="observations/test_*.json",
+                                  help="Glob of the observation files to take the positions from")
+    arguments_parser.add_argument("--positions", type=int, default=10,
+                                  help="Maximum number of positions per observation file")
+    arguments_parser.add_argument("--interval", type=int, default=5,
+                                  help="Number of moves of player 0 between two positions")
+    arguments_parser.add_argument("--depth", type=int, default=None,
+                                  help="Search every position to this fixed depth instead of using the time limit")
+    arguments_parser.add_argument("--baseline", type=str, default="benchmark_baseline.json",
+                                  help="Baseline file to compare with")
+    arguments_parser.add_argument("--save", action="store_true",
+                                  help="Save this run as the new baseline")
+    arguments_parser.add_argument("--tolerance", type=float, default=0.2,
+                                  help="Relative change accepted before reporting a regression")
+    args = arguments_parser.parse_args()
+
+    results = {}
+    print("position\tdepth\tnodes\tnodes/s\ttt hits\tcutoffs")
+    for filename in sorted(glob.glob(args.observations)):
+        for step, msg in collect_positions(filename, args.positions, args.interval):
+            name = f"{os.path.basename(filename)}:{step}"
+            results[name] = result = measure(msg, args.depth)
+            print(f"{name}\t{result['depth']}\t{result['nodes']}\t{result['nodes_per_second']:.0f}"
+                  f"\t{result['tt_hit_rate']:.3f}\t{result['cutoff_ratio']:.3f}")
+
+    summary = summarize(results)
+    print(f"mean\t{summary['depth']:.2f}\t{summary['nodes']:.0f}\t{summary['nodes_per_second']:.0f}"
+          f"\t{summary['tt_hit_rate']:.3f}\t{summary['cutoff_ratio']:.3f}")
+
+    mode = "timed" if args.depth is None else f"depth_{args.depth}"
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as f:
+            baselines = json.load(f)
+
+    if args.save:
+        baselines[mode] = {"summary": summary, "positions": results}
+        with open(args.baseline, 'w') as f:
+            json.dump(baselines, f, indent=2)
+        print("Baseline saved to", args.baseline)
+    elif mode in baselines:
+        regressions = find_regressions(summary, baselines[mode]["summary"], args.depth, args.tolerance)
+        for regression in regressions:
+            print("REGRESSION:", regression)
+        if regressions:
+            sys.exit(1)
+        print("No regression against", args.baseline)
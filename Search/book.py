@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+import os
+from hashlib import blake2b
+
+import numpy as np
+
+# Layout of the entries of a book file, sorted by key
+BOOK_DTYPE = np.dtype([("key", "<u8"), ("move", "i1"), ("depth", "u1")])
+
+
+def scenario_fingerprint(observation_rows):
+    """
+    Fingerprint of the observations of a game, so that positions of different scenarios do not share entries
+    :param observation_rows: observations of the whole game, see game_tree.observation_rows
+    :return: 64-bit integer
+    """
+    digest = blake2b(np.array(observation_rows, dtype=np.int8).tobytes(), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+class PositionBook:
+    """
+    Moves searched at the root in previous games. The book file holds an array of (key, move, depth) entries sorted by
+    key, memory-mapped when the book is opened and searched by bisection. The key of an entry is the hash of the root
+    (see compute_hash) xor-ed with the fingerprint of the scenario, since the same position has different futures in
+    different scenarios. New entries stay in memory until save() merges them into the file.
+    """
+
+    def __init__(self, filename, fingerprint=0):
+        """
+        :param filename: path of the book file, created by save() if it does not exist
+        :param fingerprint: fingerprint of the scenario, see scenario_fingerprint
+        """
+        self.filename = filename
+        self.fingerprint = fingerprint
+        if os.path.exists(filename):
+            self.entries = np.load(filename, mmap_mode="r")
+        else:
+            self.entries = np.zeros(0, dtype=BOOK_DTYPE)
+        # Entries of this game: key -> (move, depth)
+        self.new_entries = {}
+        self.hits = 0
+
+    def __len__(self):
+        return len(self.entries) + len(self.new_entries)
+
+    def probe(self, key):
+        """
+        Look up the move of a position
+        :param key: hash of the root node
+        :return: 2-tuple (move, depth) or None if the position is not in the book
+        """
+        key ^= self.fingerprint
+        entry = self.new_entries.get(key)
+        if entry is None and len(self.entries) != 0:
+            keys = self.entries["key"]
+            index = int(np.searchsorted(keys, np.uint64(key)))
+            if index < len(keys) and int(keys[index]) == key:
+                entry = int(self.entries["move"][index]), int(self.entries["depth"][index])
+        if entry is not None:
+            self.hits += 1
+        return entry
+
+    def store(self, key, move, depth):
+        """
+        Add the result of a search, unless the book already has a deeper one
+        :param key: hash of the root node
+        :param move: best move found
+        :param depth: depth the move was searched to
+        :return:
+        """
+        entry = self.probe(key)
+        if entry is not None:
+            self.hits -= 1
+            if entry[1] >= depth:
+                return
+        self.new_entries[key ^ self.fingerprint] = (move, min(depth, 255))
+
+    def save(self):
+        """
+        Merge the new entries into the book file. The file is replaced atomically, so that games running at the same
+        time never read a partial book.
+        :return:
+        """
+        if len(self.new_entries) == 0:
+            return
+        new_entries = np.array([(key, move, depth) for key, (move, depth) in self.new_entries.items()],
+                               dtype=BOOK_DTYPE)
+        # Sort by key, then by decreasing depth, and keep the first entry of every key
+        entries = np.concatenate([np.asarray(self.entries), new_entries])
+        entries = entries[np.lexsort((-entries["depth"].astype(np.int16), entries["key"]))]
+        keep = np.ones(len(entries), dtype=bool)
+        keep[1:] = entries["key"][1:] != entries["key"][:-1]
+        entries = entries[keep]
+
+        temporary_filename = self.filename + ".tmp"
+        with open(temporary_filename, "wb") as f:
+            np.save(f, entries)
+        os.replace(temporary_filename, self.filename)
+        self.entries = np.load(self.filename, mmap_mode="r")
+        self.new_entries = {}
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+import argparse
+import glob
+import os
+import sys
+
+from fishing_game_core.datafile import load_json_checked, save_binary_sequences, validate_sequences
+
+# Extension of the binary observations files
+BINARY_EXTENSION = ".obs"
+
+
+def convert(filename, output_dir=None, check_only=False, force=False):
+    """
+    Validate a JSON observations file and convert it to the binary format
+    :param filename: path to the JSON file
+    :param output_dir: directory of the binary file, the directory of the JSON file by default
+    :param check_only: only validate the file
+    :param force: convert the file even if it is not valid, with the values json.load gives
+    :return: list of the problems found in the file
+    """
+    data, duplicates = load_json_checked(filename)
+    problems = validate_sequences(data, duplicates)
+    if check_only or (problems and not force):
+        return problems
+
+    name = os.path.splitext(os.path.basename(filename))[0] + BINARY_EXTENSION
+    save_binary_sequences(data, os.path.join(output_dir or os.path.dirname(filename), name))
+    return problems
+
+
+if __name__ == '__main__':
+    # Arguments parsing
+    arguments_parser = argparse.ArgumentParser(
+        description="Validate observations files and convert them to the binary format")
+    arguments_parser.add_argument("files", type=str, nargs="+",
+                                  help="JSON observations files, or directories of them")
+    arguments_parser.add_argument("--output-dir", type=str, default=None,
+                                  help="Directory of the binary files, next to the JSON files by default")
+    arguments_parser.add_argument("--check", action="store_true",
+                                  help="Only validate the files")
+    arguments_parser.add_argument("--force", action="store_true",
+                                  help="Convert the invalid files too, keeping the last value of duplicate keys")
+    args = arguments_parser.parse_args()
+
+    filenames = []
+    for path in args.files:
+        filenames += sorted(glob.glob(os.path.join(path, "*.json"))) if os.path.isdir(path) else [path]
+    if args.output_dir is not None:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    n_invalid = 0
+    for filename in filenames:
+        problems = convert(filename, args.output_dir, check_only=args.check, force=args.force)
+        n_invalid += len(problems) > 0
+        status = "invalid" if problems else "ok"
+        if not args.check and (not problems or args.force):
+            status += ", converted"
+        print(f"{filename}: {status}")
+        for problem in problems:
+            print(f"\t{problem}")
+    sys.exit(1 if n_invalid else 0)
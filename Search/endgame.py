@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+import time
+
+from fishing_game_core.game_tree import FishTrajectories, SearchState
+
+# Largest number of fish left for which the endgame solver is tried
+ENDGAME_FISH = 2
+# Seconds the solver may spend on a turn before leaving the rest of the turn to the regular search
+ENDGAME_TIME = 0.003
+# Steps after which any hook can be anywhere: a hook moves every other step and is at most 10 + 19 cells away
+REACH_HORIZON = 2 * (10 + 19) + 2
+# Row of the surface, where the fish on a rod are pulled in
+SURFACE = 19
+
+
+def own_moves(step, mover, target_step, player):
+    """
+    Number of moves a player plays between two steps
+    :param step: current step
+    :param mover: player to move at the current step
+    :param target_step: later step
+    :param player: either 0 or 1
+    :return: number of moves of the player in [step, target_step)
+    """
+    n_moves = target_step - step
+    return (n_moves + 1) // 2 if mover == player else n_moves // 2
+
+
+class EndgameSolver:
+    """
+    Solver for the positions with at most ENDGAME_FISH fish left. Every position gets an interval bounding the final
+    score difference:
+        - a fish on a rod is pulled in by its player if enough moves are left to bring it to the surface, since the
+          player can only move up,
+        - a free fish can only go to a player whose hook can reach one of its future positions, with the wrapped
+          metric of distance_from_catch, early enough to pull it in before the end. Nobody may get it as well.
+    The intervals ignore that the hooks block each other, so they are always sound. A depth-limited minimax of the
+    lower and of the upper bounds then gives bounds of the value of every root move, and a move is proven best when its
+    lower bound reaches the upper bound of every other move.
+    """
+
+    def __init__(self):
+        # Imported here because player.py imports this module
+        from player import distance_from_catch
+        self.distance = distance_from_catch
+        self.trajectories = None
+        # Cache of the reachability of the free fish, see reachable
+        self.reachable_cache = {}
+        # Deepest depth of the last solve and bounds of the value of the proven move
+        self.depth = 0
+        self.value = None
+        self.deadline = 0.0
+
+    @staticmethod
+    def applies(node):
+        """
+        Whether a position is worth trying to solve
+        :param node: root node
+        :return: bool
+        """
+        return sum(position is not None for position in node.state.fish) <= ENDGAME_FISH
+
+    def solve(self, node, initial_time, time_limit=ENDGAME_TIME):
+        """
+        Look for a proven best move by iterative deepening
+        :param node: root node, with player 0 to move
+        :param initial_time: the time at the beginning of the search
+        :param time_limit: seconds after initial_time the solver may use
+        :return: the proven best move, or None if nothing was proven in time
+        """
+        self.depth = 0
+        self.value = None
+        moves = node.legal_moves()
+        if len(moves) == 1:
+            # Forced move, e.g. pulling up a fish
+            return moves[0]
+        if len(moves) == 0:
+            return None
+
+        self.trajectories = FishTrajectories([node])
+        self.reachable_cache = {}
+        self.deadline = initial_time + time_limit
+        state = SearchState(node, self.trajectories)
+        remaining_steps = len(node.observations) - node.depth
+        try:
+            for depth in range(1, remaining_steps + 1):
+                bounds = {}
+                for move in moves:
+                    state.apply(move)
+                    bounds[move] = (self.bound_search(state, depth - 1, float("-inf"), float("inf"), True),
+                                    self.bound_search(state, depth - 1, float("-inf"), float("inf"), False))
+                    state.undo()
+                self.depth = depth
+                best_move = max(moves, key=lambda move: bounds[move][0])
+                if all(bounds[best_move][0] >= bounds[move][1] for move in moves if move != best_move):
+                    self.value = bounds[best_move]
+                    return best_move
+        except TimeoutError:
+            pass
+        return None
+
+    def bound_search(self, state, depth, alpha, beta, lower):
+        """
+        Alpha beta pruning on the lower or upper bounds of the positions
+        :param state: SearchState instance, left unchanged unless the search times out
+        :param depth: depth maximum to go down the tree
+        :param alpha: the current best value achievable by 0
+        :param beta: the current best value achievable by 1
+        :param lower: search the lower bounds if True, the upper bounds otherwise
+        :return: bound of the minimax value of the state
+        """
+        if time.time() >= self.deadline:
+            raise TimeoutError
+        low, high = self.bounds(state)
+        moves = state.legal_moves()
+        if low == high or depth == 0 or len(moves) == 0:
+            return low if lower else high
+
+        if state.player == 0:
+            value = float("-inf")
+            for move in moves:
+                state.apply(move)
+                value = max(value, self.bound_search(state, depth - 1, alpha, beta, lower))
+                state.undo()
+                alpha = max(alpha, value)
+                if alpha >= beta:
+                    break
+        else:
+            value = float("inf")
+            for move in moves:
+                state.apply(move)
+                value = min(value, self.bound_search(state, depth - 1, alpha, beta, lower))
+                state.undo()
+                beta = min(beta, value)
+                if alpha >= beta:
+                    break
+        return value
+
+    def bounds(self, state):
+        """
+        Interval of the final score difference of a position
+        :param state: SearchState instance
+        :return: 2-tuple with the lower and upper bound
+        """
+        low = high = state.scores[0] - state.scores[1]
+        caught = state.caught
+        for fish_number, position in enumerate(state.fish):
+            if position is None:
+                continue
+            score = state.fish_scores[fish_number]
+            if fish_number in caught:
+                player = caught.index(fish_number)
+                if own_moves(state.step, state.player, state.n_steps, player) >= SURFACE - position[1]:
+                    outcome = score if player == 0 else -score
+                    low += outcome
+                    high += outcome
+                continue
+            outcomes = [0]
+            for player in range(2):
+                if self.reachable(state, fish_number, player):
+                    outcomes.append(score if player == 0 else -score)
+            low += min(outcomes)
+            high += max(outcomes)
+        return low, high
+
+    def reachable(self, state, fish_number, player):
+        """
+        Whether the hook of a player may catch a free fish and pull it in before the end of the game
+        :param state: SearchState instance
+        :param fish_number: number of a free fish
+        :param player: either 0 or 1
+        :return: bool
+        """
+        hook = state.hooks[player]
+        key = (fish_number, player, hook, state.step, state.player)
+        cache = self.reachable_cache
+        if key in cache:
+            return cache[key]
+
+        step, mover, n_steps = state.step, state.player, state.n_steps
+        trajectories = self.trajectories
+        last_step = min(n_steps, step + REACH_HORIZON)
+        trajectories.extend(last_step)
+        total_moves = own_moves(step, mover, n_steps, player)
+        reachable = n_steps > last_step
+        for target_step in range(step + 1, last_step + 1):
+            if reachable:
+                break
+            position = trajectories.positions[target_step - trajectories.first_step][fish_number]
+            moves = own_moves(step, mover, target_step, player)
+            reachable = (self.distance(position, hook) <= moves and
+                         total_moves - moves >= SURFACE - position[1])
+        cache[key] = reachable
+        return reachable
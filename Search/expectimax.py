@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+import time
+
+import numpy as np
+
+from fishing_game_core.game_tree import FishTrajectories, FISH_MOVES, FISH_MOVE_CELLS, SPACE_SUBDIVISIONS, move_hook
+from time_manager import TimeManager, CLOCK_CHECK_MASK
+
+# Number of cells of the grid, numbered x * SPACE_SUBDIVISIONS + y
+N_CELLS = SPACE_SUBDIVISIONS ** 2
+# Row of the surface, where the fish on a rod are pulled in
+SURFACE = 19
+
+
+def closeness_kernel():
+    """
+    exp(-distance) between every pair of cells, with the wrapped Manhattan distance of distance_from_catch
+    :return: symmetric NumPy array indexed by [cell, cell]
+    """
+    x, y = np.divmod(np.arange(N_CELLS), SPACE_SUBDIVISIONS)
+    delta_x = np.abs(x[:, None] - x[None, :])
+    distance = np.minimum(delta_x, SPACE_SUBDIVISIONS - delta_x) + np.abs(y[:, None] - y[None, :])
+    return np.exp(-distance)
+
+
+# exp(-distance) between every pair of cells
+CLOSENESS = closeness_kernel()
+
+
+class FishDistributions:
+    """
+    Probability of every free fish to be on every cell, at every step of a search. Up to the horizon the observations
+    are trusted and the distributions are certain. Past it every fish moves at random, with the frequencies of the
+    moves it made within the horizon, and the distributions are propagated through FISH_MOVE_CELLS for all the fish
+    at once. The probabilities are those of the fish that are never caught: being caught elsewhere is ignored.
+    """
+
+    def __init__(self, node, horizon):
+        """
+        :param node: root node of the search
+        :param horizon: number of steps of observations trusted from the root
+        """
+        self.first_step = node.depth
+        # Last step whose positions follow from the trusted observations
+        self.horizon_step = horizon_step = min(node.depth + horizon, len(node.observations))
+        self.trajectories = FishTrajectories([node])
+        n_fish = self.n_fish = len(node.state.fish)
+
+        # Frequencies of the moves of every fish within the horizon, with one extra count of each move
+        counts = np.ones((n_fish, len(FISH_MOVES)))
+        if horizon_step > node.depth:
+            rows = np.array([node.observations[step] for step in range(node.depth, horizon_step)])
+            counts += (rows[:, :, None] == np.arange(len(FISH_MOVES))).sum(axis=0)
+        self.move_probabilities = counts / counts.sum(axis=1, keepdims=True)
+        # Flat index of the destination of every (fish, move, cell), to propagate every fish with one bincount
+        self.destinations = (np.arange(n_fish)[:, None, None] * N_CELLS + FISH_MOVE_CELLS[None, :, :]).ravel()
+
+        # Distributions of every step from first_step, shape (fish, cells)
+        self.distributions = []
+        # The same distributions as nested lists, indexed by [step - first_step][fish][cell]
+        self.catch = []
+        # Expected exp(-distance) of every fish to a hook on every cell, indexed by [step - first_step][fish][cell]
+        self.closeness = []
+        self.extend(self.first_step)
+
+    def extend(self, step):
+        """
+        Compute the distributions up to some step
+        :param step: depth in the game tree
+        :return:
+        """
+        distributions = self.distributions
+        while len(distributions) <= step - self.first_step:
+            distribution_step = self.first_step + len(distributions)
+            if distribution_step <= self.horizon_step:
+                # Certain positions
+                self.trajectories.extend(distribution_step)
+                distribution = np.zeros((self.n_fish, N_CELLS))
+                for fish_number, position in enumerate(self.trajectories.positions[-1]):
+                    if position is not None:
+                        distribution[fish_number, position[0] * SPACE_SUBDIVISIONS + position[1]] = 1.0
+            else:
+                previous = distributions[-1]
+                weights = previous[:, None, :] * self.move_probabilities[:, :, None]
+                distribution = np.bincount(self.destinations, weights.ravel(),
+                                           minlength=previous.size).reshape(previous.shape)
+            distributions.append(distribution)
+            self.catch.append(distribution.tolist())
+            self.closeness.append((distribution @ CLOSENESS).tolist())
+
+
+class ExpectimaxSearch:
+    """
+    Search for when the fish observations past a horizon are not known. The players alternate MAX and MIN nodes as in
+    the minimax search, but every move is followed by a chance node over the fish that may be on the hooks, with the
+    probabilities of FishDistributions. Within the horizon the chance nodes have a single outcome and the search is
+    the minimax search of the game. The chance nodes are pruned with Star1, from bounds of the final score difference.
+
+    A state is a tuple (player, hooks, caught, rods, scores, free): the fish on each rod (-1 if none) and their
+    positions, and a bitmask of the free fish.
+    """
+
+    def __init__(self, horizon):
+        """
+        :param horizon: number of steps of observations trusted from the root
+        """
+        self.horizon = horizon
+        self.distributions = None
+        self.fish_scores = None
+        self.n_fish = 0
+        self.n_steps = 0
+        # Best move of the states searched by the previous iterations, tried first
+        self.best_moves = {}
+        # Deepest depth completed by the last search and number of decision nodes searched
+        self.depth = 0
+        self.nodes = 0
+        self.initial_time = 0.0
+        self.time_budget = 0.0
+
+    def search(self, node, initial_time, time_budget):
+        """
+        Iterative deepening expectimax search of the root
+        :param node: root node, with player 0 to move
+        :param initial_time: the time at the beginning of the search
+        :param time_budget: seconds after initial_time the search may use, see TimeManager.budget
+        :return: the best move
+        """
+        state = node.state
+        moves = node.legal_moves()
+        self.depth = 0
+        if len(moves) <= 1:
+            return moves[0] if moves else 0
+
+        self.distributions = FishDistributions(node, self.horizon)
+        self.fish_scores = state.fish_scores
+        self.n_fish = len(state.fish)
+        self.n_steps = len(node.observations)
+        self.best_moves = {}
+        self.nodes = 0
+        self.initial_time, self.time_budget = initial_time, time_budget
+        rods = tuple(None if fish_number == -1 else state.fish[fish_number] for fish_number in state.caught)
+        free = 0
+        for fish_number, position in enumerate(state.fish):
+            if position is not None and fish_number not in state.caught:
+                free |= 1 << fish_number
+        root = (0, tuple(state.hooks), tuple(state.caught), rods, tuple(state.scores), free)
+
+        best_move = moves[0]
+        previous_nodes = 0
+        for depth in range(1, self.n_steps - node.depth + 1):
+            iteration_start, iteration_start_nodes = time.time(), self.nodes
+            moves.sort(key=lambda move: move != best_move)
+            value, iteration_best_move = float("-inf"), best_move
+            try:
+                for i, move in enumerate(moves):
+                    move_value = self.chance_value(root, node.depth, move, depth, value, float("inf"))
+                    if move_value > value:
+                        if i > 0:
+                            # Proven better than the best move of the previous depth, kept if the depth times out
+                            best_move = move
+                        value, iteration_best_move = move_value, move
+            except TimeoutError:
+                break
+            best_move = iteration_best_move
+            self.depth = depth
+
+            now = time.time()
+            iteration_nodes = self.nodes - iteration_start_nodes
+            if not TimeManager.should_deepen(now - initial_time, time_budget, now - iteration_start,
+                                             iteration_nodes, previous_nodes):
+                break
+            previous_nodes = iteration_nodes
+        return best_move
+
+    def evaluate(self, state, step):
+        """
+        Heuristic of a state, as evaluate_state but with the expected closeness of the free fish to the hook of player
+        0. A fish on a rod counts as pulled in, which keeps the values finite.
+        :param state: state tuple
+        :param step: depth of the state in the game tree
+        :return: the heuristic of the state
+        """
+        _, hooks, caught, _, scores, free = state
+        fish_scores = self.fish_scores
+        value = scores[0] - scores[1]
+        if caught[0] != -1:
+            value += fish_scores[caught[0]]
+        if caught[1] != -1:
+            value -= fish_scores[caught[1]]
+        hook = hooks[0]
+        cell = hook[0] * SPACE_SUBDIVISIONS + hook[1]
+        closeness = self.distributions.closeness[step - self.distributions.first_step]
+        estimation = 0
+        fish_number = 0
+        while free >> fish_number:
+            if free >> fish_number & 1:
+                estimation = max(estimation, fish_scores[fish_number] * closeness[fish_number][cell])
+            fish_number += 1
+        return value + estimation
+
+    def bounds(self, state):
+        """
+        Interval of the values of a state and of every state below it: every fish not pulled in yet may still change
+        the score difference, and once more the estimation, by its score
+        :param state: state tuple
+        :return: 2-tuple with the lower and upper bound
+        """
+        _, _, caught, _, scores, free = state
+        remaining = sum(abs(self.fish_scores[fish_number]) for fish_number in range(self.n_fish)
+                        if free >> fish_number & 1 or fish_number in caught)
+        return scores[0] - scores[1] - 2 * remaining, scores[0] - scores[1] + 2 * remaining
+
+    def outcomes(self, state, step, move):
+        """
+        States that a move may lead to, as Node.compute_next_state: the hook moves, the fish on the rods at the
+        surface are pulled in, and the empty hooks may catch a fish
+        :param state: state tuple
+        :param step: depth of the state in the game tree
+        :param move: legal integer action of the player to move
+        :return: list of 2-tuples (probability, state), most likely first
+        """
+        player, hooks, caught, rods, scores, free = state
+        hooks, caught, rods, scores = list(hooks), list(caught), list(rods), list(scores)
+        if caught[player] != -1:
+            # Fishes on rod of current player can only move up
+            rods[player] = FISH_MOVES[0][rods[player]]
+        hooks[player] = move_hook(hooks[player], move, hooks[1 - player])
+
+        fish_scores = self.fish_scores
+        empty_rods = []
+        for i_player in range(2):
+            fish_number = caught[i_player]
+            if fish_number == -1:
+                empty_rods.append(i_player)
+            elif rods[i_player][1] >= SURFACE:
+                scores[i_player] += fish_scores[fish_number]
+                caught[i_player] = -1
+                rods[i_player] = None
+
+        outcomes = [(1.0, caught, rods, scores, free)]
+        catch = self.distributions.catch[step + 1 - self.distributions.first_step]
+        for i_player in empty_rods:
+            hook = hooks[i_player]
+            cell = hook[0] * SPACE_SUBDIVISIONS + hook[1]
+            new_outcomes = []
+            for probability, caught, rods, scores, free in outcomes:
+                fish_numbers = [fish_number for fish_number in range(self.n_fish)
+                                if free >> fish_number & 1 and catch[fish_number][cell] > 0.0]
+                certain = [fish_number for fish_number in fish_numbers if catch[fish_number][cell] == 1.0]
+                if certain:
+                    # Within the horizon: the first fish on the hook, as compute_caught_fish
+                    fish_probabilities = [(certain[0], 1.0)]
+                else:
+                    fish_probabilities = [(fish_number, catch[fish_number][cell]) for fish_number in fish_numbers]
+                    total = sum(p for _, p in fish_probabilities)
+                    if total > 1.0:
+                        fish_probabilities = [(fish_number, p / total) for fish_number, p in fish_probabilities]
+                    elif total < 1.0:
+                        new_outcomes.append((probability * (1.0 - total), caught, rods, scores, free))
+                for fish_number, fish_probability in fish_probabilities:
+                    new_caught, new_rods, new_scores = list(caught), list(rods), list(scores)
+                    if hook[1] >= SURFACE:
+                        new_scores[i_player] += fish_scores[fish_number]
+                    else:
+                        new_caught[i_player] = fish_number
+                        new_rods[i_player] = hook
+                    new_outcomes.append((probability * fish_probability, new_caught, new_rods, new_scores,
+                                         free & ~(1 << fish_number)))
+            outcomes = new_outcomes
+
+        hooks = tuple(hooks)
+        outcomes.sort(key=lambda outcome: -outcome[0])
+        return [(probability, (1 - player, hooks, tuple(caught), tuple(rods), tuple(scores), free))
+                for probability, caught, rods, scores, free in outcomes]
+
+    def chance_value(self, state, step, move, depth, alpha, beta):
+        """
+        Expected value of a move, with Star1 pruning of the outcomes
+        :param state: state tuple
+        :param step: depth of the state in the game tree
+        :param move: legal integer action of the player to move
+        :param depth: depth maximum to go down the tree, this move included
+        :param alpha: the current best value achievable by 0
+        :param beta: the current best value achievable by 1
+        :return: the expected value, or a bound of it outside of (alpha, beta)
+        """
+        self.distributions.extend(step + 1)
+        outcomes = self.outcomes(state, step, move)
+        if len(outcomes) == 1:
+            return self.value(outcomes[0][1], step + 1, depth - 1, alpha, beta)
+
+        low, high = self.bounds(state)
+        expected = 0.0
+        remaining = 1.0
+        for probability, child in outcomes:
+            remaining = max(remaining - probability, 0.0)
+            # Window of the child outside of which the expectation is out of (alpha, beta) whatever the rest gives
+            child_alpha = max((alpha - expected - remaining * high) / probability, low)
+            child_beta = min((beta - expected - remaining * low) / probability, high)
+            expected += probability * self.value(child, step + 1, depth - 1, child_alpha, child_beta)
+            if expected + remaining * high <= alpha:
+                return expected + remaining * high
+            if expected + remaining * low >= beta:
+                return expected + remaining * low
+        return expected
+
+    def value(self, state, step, depth, alpha, beta):
+        """
+        Alpha beta pruning on the decision nodes
+        :param state: state tuple
+        :param step: depth of the state in the game tree
+        :param depth: depth maximum to go down the tree
+        :param alpha: the current best value achievable by 0
+        :param beta: the current best value achievable by 1
+        :return: the expectimax value of the state, or a bound of it outside of (alpha, beta)
+        """
+        self.nodes += 1
+        if self.nodes & CLOCK_CHECK_MASK == 0 and time.time() - self.initial_time >= self.time_budget:
+            raise TimeoutError
+        if depth == 0 or step == self.n_steps:
+            return self.evaluate(state, step)
+
+        player = state[0]
+        key = (step, state)
+        best_move = self.best_moves.get(key)
+        moves = [1] if state[2][player] != -1 else [0, 1, 2, 3, 4]
+        if best_move is not None and len(moves) > 1:
+            moves.remove(best_move)
+            moves.insert(0, best_move)
+
+        if player == 0:
+            value = float("-inf")
+            for move in moves:
+                move_value = self.chance_value(state, step, move, depth, alpha, beta)
+                if move_value > value:
+                    value, best_move = move_value, move
+                alpha = max(alpha, value)
+                if alpha >= beta:
+                    break
+        else:
+            value = float("inf")
+            for move in moves:
+                move_value = self.chance_value(state, step, move, depth, alpha, beta)
+                if move_value < value:
+                    value, best_move = move_value, move
+                beta = min(beta, value)
+                if alpha >= beta:
+                    break
+        self.best_moves[key] = best_move
+        return value
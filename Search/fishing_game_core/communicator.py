@@ -1,4 +1,147 @@
+import math
+import multiprocessing as mp
 import sys
+import time
+
+from fishing_game_core.shared import ACTION_TO_STR
+
+STR_TO_ACTION = {value: key for key, value in ACTION_TO_STR.items()}
+
+# Number of messages a channel holds before the sender waits for the receiver
+RING_SLOTS = 4
+# Fish numbers a state message can describe, the messages with more fish go through the pipe
+MAX_FISH = 64
+# Kind of message held by a slot. A pipe slot tells the receiver to read the next message from the pipe.
+PIPE_SLOT, STATE_SLOT, ACTION_SLOT = 0, 1, 2
+# Layout of a slot: kind, step, game over, time sent, hooks (x, y) of both players, scores of both players, fish on
+# the rods of both players (-1 for none) and number of fish, then (x, y, score) of every fish, NaN for a missing fish.
+# An action slot holds the kind, the action and the search time (NaN for none).
+HEADER_SIZE = 13
+SLOT_SIZE = HEADER_SIZE + 3 * MAX_FISH
+# Keys of the state messages sent by the minimax game, see FishingDerbyMinimaxApp.build_minimax_msg
+STATE_KEYS = {"game_over", "step", "time_sent", "hooks_positions", "fishes_positions", "observations", "fish_scores",
+              "player_scores", "caught_fish"}
+
+
+def encode_message(msg):
+    """
+    Values of the slot describing a message
+    :param msg: message to send
+    :return: list of floats, or None if the message does not fit the layout of a slot
+    """
+    if set(msg) <= {"action", "search_time"} and msg.get("action") in STR_TO_ACTION:
+        search_time = msg.get("search_time")
+        return [ACTION_SLOT, STR_TO_ACTION[msg["action"]], math.nan if search_time is None else search_time]
+
+    # Only the compact state messages fit, the others carry the observation sequences
+    if not set(msg) <= STATE_KEYS or "step" not in msg or msg.get("observations"):
+        return None
+    fish_numbers = msg["fishes_positions"].keys()
+    if any(fish_number >= MAX_FISH for fish_number in fish_numbers):
+        return None
+    n_fish = max(fish_numbers, default=-1) + 1
+    hooks, scores, caught = msg["hooks_positions"], msg["player_scores"], msg["caught_fish"]
+    values = [STATE_SLOT, msg["step"], msg["game_over"], msg.get("time_sent", math.nan),
+              hooks[0][0], hooks[0][1], hooks[1][0], hooks[1][1], scores[0], scores[1],
+              -1 if caught[0] is None else caught[0], -1 if caught[1] is None else caught[1], n_fish]
+    values += [math.nan] * (3 * n_fish)
+    for fish_number, position in msg["fishes_positions"].items():
+        start = HEADER_SIZE + 3 * fish_number
+        values[start:start + 3] = position[0], position[1], msg["fish_scores"][fish_number]
+    # The values are sent as floats, which must give back the same integers
+    if any(value != int(value) for value in values[4:] if not math.isnan(value)):
+        return None
+    return values
+
+
+def decode_message(values):
+    """
+    Message described by the values of a slot
+    :param values: list of floats, see encode_message
+    :return: dict
+    """
+    if values[0] == ACTION_SLOT:
+        return {"action": ACTION_TO_STR[int(values[1])], "search_time": None if math.isnan(values[2]) else values[2]}
+
+    integers = [int(value) for value in values[4:HEADER_SIZE]]
+    msg = {"game_over": bool(values[2]), "step": int(values[1]),
+           "hooks_positions": {0: (integers[0], integers[1]), 1: (integers[2], integers[3])},
+           "fishes_positions": {}, "observations": {}, "fish_scores": {},
+           "player_scores": {0: integers[4], 1: integers[5]},
+           "caught_fish": {0: None if integers[6] == -1 else integers[6],
+                           1: None if integers[7] == -1 else integers[7]}}
+    if not math.isnan(values[3]):
+        msg["time_sent"] = values[3]
+    for fish_number in range(integers[8]):
+        x, y, score = values[HEADER_SIZE + 3 * fish_number:HEADER_SIZE + 3 * fish_number + 3]
+        if not math.isnan(score):
+            msg["fishes_positions"][fish_number] = (int(x), int(y))
+            msg["fish_scores"][fish_number] = int(score)
+    return msg
+
+
+class SharedMemoryChannel:
+    """
+    One-way transport of the messages of every turn through a ring buffer of fixed-layout slots in shared memory. A
+    message is written as floats into the next slot, so that nothing is pickled, and a semaphore counting the unread
+    messages wakes the receiver up. The messages that do not fit a slot, such as the first message with the observation
+    sequences, go through the pipe, and their slot only tells the receiver to read the pipe, which keeps the messages
+    in order. The channel only uses RawArray and Semaphore, so it must be created before the processes start.
+    """
+
+    def __init__(self, slots=RING_SLOTS, context=mp):
+        """
+        :param slots: number of messages the channel holds
+        :param context: multiprocessing context the processes are started with
+        """
+        self.slots = slots
+        self.data = context.RawArray('d', slots * SLOT_SIZE)
+        # Number of messages written and read since the channel was created
+        self.counters = context.RawArray('q', 2)
+        # Released once per message, after its slot is written
+        self.unread = context.Semaphore(0)
+
+    def send(self, msg, pipe):
+        """
+        Send a message
+        :param msg: dict
+        :param pipe: pipe the messages that do not fit a slot are sent through
+        :return:
+        """
+        values = encode_message(msg)
+        if values is None:
+            pipe.send(msg)
+            values = [PIPE_SLOT]
+        written = self.counters[0]
+        while written - self.counters[1] >= self.slots:
+            # The receiver has not read the oldest message yet
+            time.sleep(0)
+        start = (written % self.slots) * SLOT_SIZE
+        self.data[start:start + len(values)] = values
+        self.counters[0] = written + 1
+        self.unread.release()
+
+    def receive(self, pipe, timeout=None):
+        """
+        Receive the next message
+        :param pipe: pipe the messages that do not fit a slot are received from
+        :param timeout: seconds to wait for the message, None to wait forever
+        :return: dict, or None if no message arrived in time
+        """
+        if not self.unread.acquire(timeout=timeout):
+            return None
+        read = self.counters[1]
+        start = (read % self.slots) * SLOT_SIZE
+        kind = self.data[start]
+        if kind == PIPE_SLOT:
+            msg = pipe.recv()
+        elif kind == ACTION_SLOT:
+            msg = decode_message(self.data[start:start + 3])
+        else:
+            n_fish = int(self.data[start + HEADER_SIZE - 1])
+            msg = decode_message(self.data[start:start + HEADER_SIZE + 3 * n_fish])
+        self.counters[1] = read + 1
+        return msg
 
 
 class Communicator:
@@ -10,6 +153,9 @@ class Communicator:
         self.receiver_pipe = None
         self.sender_pipe = None
         self.receiver_threshold = receiver_threshold
+        # Shared memory channels used instead of the pipes when set, see SharedMemoryChannel
+        self.receiver_channel = None
+        self.sender_channel = None
 
     def set_receive_send_pipes(self, recv_pipe, sender_pipe):
         """
@@ -21,14 +167,29 @@ class Communicator:
         self.receiver_pipe = recv_pipe
         self.sender_pipe = sender_pipe
 
+    def set_receive_send_channels(self, recv_channel, sender_channel):
+        """
+        Set the shared memory channels, the pipes must be set as well
+        :param recv_channel: Receiver channel
+        :param sender_channel: Sender channel
+        :return:
+        """
+        self.receiver_channel = recv_channel
+        self.sender_channel = sender_channel
+
     def receiver(self):
         """
         Receive message from the receiver pipe
         :return:
         """
-        if not self.receiver_pipe.poll(self.receiver_threshold):
-            sys.exit(-1)  # time limit
-        msg = self.receiver_pipe.recv()
+        if self.receiver_channel is not None:
+            msg = self.receiver_channel.receive(self.receiver_pipe, self.receiver_threshold)
+            if msg is None:
+                sys.exit(-1)  # time limit
+        else:
+            if not self.receiver_pipe.poll(self.receiver_threshold):
+                sys.exit(-1)  # time limit
+            msg = self.receiver_pipe.recv()
         self.check_game_over(msg)
         return msg
 
@@ -48,4 +209,7 @@ class Communicator:
         :param msg:
         :return:
         """
-        self.sender_pipe.send(msg)
+        if self.sender_channel is not None:
+            self.sender_channel.send(msg, self.sender_pipe)
+        else:
+            self.sender_pipe.send(msg)
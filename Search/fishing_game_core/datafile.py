@@ -1,5 +1,21 @@
 import json
 
+import numpy as np
+
+from fishing_game_core.shared import OBS_TO_MOVES, TYPE_TO_SCORE
+
+# First bytes of a binary observations file
+BINARY_MAGIC = b"\x93FDOBS"
+BINARY_VERSION = 1
+# Layout of a binary observations file: this header, one FISH_DTYPE record per fish, the initial positions of the two
+# hooks, then the observations as an int8 matrix of one row per step and one column per fish
+HEADER_DTYPE = np.dtype([("magic", "S6"), ("version", "<u2"), ("custom", "u1"), ("n_fish", "<u2"),
+                         ("n_steps", "<u4"), ("n_seq", "<u4")])
+FISH_DTYPE = np.dtype([("score", "<i2"), ("init_pos", "i1", (2,))])
+PLAYERS_DTYPE = np.dtype(("i1", (2, 2)))
+# Size of the grid, every coordinate of a position is in range(SPACE_SUBDIVISIONS)
+SPACE_SUBDIVISIONS = 20
+
 
 class Datafile:
     def __init__(self, ):
@@ -16,4 +32,132 @@ class ModelsDatafile(Datafile):
 
 
 class SequencesDatafile(Datafile):
-    pass
+    def load(self, filename):
+        """
+        Load an observations file, either JSON or binary (see save_binary_sequences)
+        :param filename: path to the file
+        :return:
+        """
+        with open(filename, 'rb') as f:
+            binary = f.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+        if binary:
+            self.data = load_binary_sequences(filename)
+        else:
+            super().load(filename)
+
+
+def load_json_checked(filename):
+    """
+    Load a JSON observations file, keeping track of the keys that appear twice in an object, which json.load
+    silently collapses into the last value
+    :param filename: path to the JSON file
+    :return: 2-tuple (data as json.load gives it, list of the duplicate keys)
+    """
+    duplicates = []
+
+    def collect_pairs(pairs):
+        seen = set()
+        for key, _ in pairs:
+            if key in seen:
+                duplicates.append(key)
+            seen.add(key)
+        return dict(pairs)
+
+    with open(filename, 'r') as f:
+        data = json.load(f, object_pairs_hook=collect_pairs)
+    return data, duplicates
+
+
+def validate_sequences(data, duplicates=()):
+    """
+    Check that a scenario describes a playable game
+    :param data: scenario, as loaded by Sequences
+    :param duplicates: duplicate keys found in the file, see load_json_checked
+    :return: list of the problems found, as strings, empty for a valid scenario
+    """
+    problems = ["duplicate key '%s'" % key for key in duplicates]
+    missing = [field for field in ("init_fishes", "init_players", "params", "sequence") if field not in data]
+    if missing:
+        return problems + ["missing field '%s'" % field for field in missing]
+
+    init_fishes, sequence = data["init_fishes"], data["sequence"]
+    n_seq = data["params"].get("n_seq")
+    if set(init_fishes) != {str(i) for i in range(len(init_fishes))}:
+        problems.append("fish numbers %s are not 0 to %d" % (sorted(init_fishes), len(init_fishes) - 1))
+    if set(sequence) != set(init_fishes):
+        problems.append("fish with a sequence %s differ from the initial fish %s" %
+                        (sorted(sequence), sorted(init_fishes)))
+
+    def check_position(position, name):
+        if len(position) != 2 or any(not 0 <= coordinate < SPACE_SUBDIVISIONS for coordinate in position):
+            problems.append("%s is not on the grid: %s" % (name, position))
+
+    for key, fish in init_fishes.items():
+        check_position(fish.get("init_pos", ()), "initial position of fish %s" % key)
+        if fish.get("score") not in TYPE_TO_SCORE.values():
+            problems.append("score of fish %s is not the score of a fish type: %s" % (key, fish.get("score")))
+    for key in ("0", "1"):
+        check_position(data["init_players"].get(key, ()), "initial position of hook %s" % key)
+    lengths = {len(observations) for observations in sequence.values()}
+    if len(lengths) > 1:
+        problems.append("the sequences have different lengths: %s" % sorted(lengths))
+    elif lengths and n_seq is not None and lengths.pop() < n_seq:
+        problems.append("the sequences are shorter than n_seq = %d" % n_seq)
+    for key, observations in sequence.items():
+        invalid = [observation for observation in observations if observation not in OBS_TO_MOVES]
+        if invalid:
+            problems.append("sequence of fish %s has invalid observations: %s" % (key, sorted(set(invalid))))
+    return problems
+
+
+def save_binary_sequences(data, filename):
+    """
+    Write a scenario to a binary observations file
+    :param data: valid scenario, as loaded by Sequences
+    :param filename: path to the binary file
+    :return:
+    """
+    n_fish = len(data["init_fishes"])
+    sequences = [data["sequence"][str(i)] for i in range(n_fish)]
+    n_steps = len(sequences[0]) if sequences else 0
+
+    header = np.zeros((), dtype=HEADER_DTYPE)
+    header["magic"], header["version"], header["custom"] = BINARY_MAGIC, BINARY_VERSION, data.get("custom", True)
+    header["n_fish"], header["n_steps"], header["n_seq"] = n_fish, n_steps, data["params"]["n_seq"]
+    fishes = np.array([(fish["score"], fish["init_pos"]) for fish in (data["init_fishes"][str(i)]
+                                                                     for i in range(n_fish))], dtype=FISH_DTYPE)
+    players = np.array([data["init_players"]["0"], data["init_players"]["1"]], dtype=np.int8)
+    observations = np.array(sequences, dtype=np.int8).reshape(n_fish, n_steps).T
+
+    with open(filename, 'wb') as f:
+        f.write(header.tobytes())
+        f.write(fishes.tobytes())
+        f.write(players.tobytes())
+        f.write(np.ascontiguousarray(observations).tobytes())
+
+
+def load_binary_sequences(filename):
+    """
+    Load a binary observations file. The observations are memory-mapped and not read, so loading takes the same
+    time whatever the length of the game.
+    :param filename: path to the binary file
+    :return: scenario, as loaded by Sequences. The sequences are int8 arrays, the columns of the mapped matrix.
+    """
+    header = np.fromfile(filename, dtype=HEADER_DTYPE, count=1)[0]
+    if header["magic"] != BINARY_MAGIC or header["version"] != BINARY_VERSION:
+        raise ValueError("%s is not a binary observations file of version %d" % (filename, BINARY_VERSION))
+    n_fish, n_steps = int(header["n_fish"]), int(header["n_steps"])
+    offset = HEADER_DTYPE.itemsize
+    fishes = np.fromfile(filename, dtype=FISH_DTYPE, count=n_fish, offset=offset)
+    offset += FISH_DTYPE.itemsize * n_fish
+    players = np.fromfile(filename, dtype=PLAYERS_DTYPE, count=1, offset=offset)[0]
+    offset += PLAYERS_DTYPE.itemsize
+    observations = np.memmap(filename, dtype=np.int8, mode='r', offset=offset, shape=(n_steps, n_fish))
+    observations = observations.view(np.ndarray)
+
+    return {"custom": bool(header["custom"]),
+            "init_fishes": {str(i): {"init_pos": fishes["init_pos"][i].tolist(), "score": int(fishes["score"][i])}
+                            for i in range(n_fish)},
+            "init_players": {"0": players[0].tolist(), "1": players[1].tolist()},
+            "params": {"n_seq": int(header["n_seq"])},
+            "sequence": {str(i): observations[:, i] for i in range(n_fish)}}
@@ -1,25 +1,242 @@
 # Game tree for Fishing Derby
+from hashlib import blake2b
 from itertools import product
 import numpy as np
 from fishing_game_core.shared import OBS_TO_MOVES, ACT_TO_MOVES
-from copy import deepcopy
+
+
+class ZobristTable(dict):
+    """
+    Lazily filled table of 64-bit Zobrist keys. The keys are derived from the table name and the item, so they are
+    the same in every process and in every run.
+    """
+
+    def __init__(self, name):
+        super().__init__()
+        self.name = name
+
+    def __missing__(self, item):
+        digest = blake2b(f"{self.name}:{item}".encode(), digest_size=8).digest()
+        value = self[item] = int.from_bytes(digest, "little")
+        return value
+
+
+# Keys of the hook of each player, indexed by (x, y)
+ZOBRIST_HOOKS = (ZobristTable("hook0"), ZobristTable("hook1"))
+# Keys of the fish, indexed by (fish_number, (x, y))
+ZOBRIST_FISH = ZobristTable("fish")
+# Keys of the fish caught by each player, indexed by fish number (-1 when nothing is caught)
+ZOBRIST_CAUGHT = (ZobristTable("caught0"), ZobristTable("caught1"))
+# Keys of the score of each player, indexed by score
+ZOBRIST_SCORES = (ZobristTable("score0"), ZobristTable("score1"))
+# Keys of the number of remaining observations, so that the same position at different times does not collide
+ZOBRIST_STEPS = ZobristTable("steps")
+# Key xor-ed in when player 1 is to move
+ZOBRIST_PLAYER = ZobristTable("player")[1]
+
+
+# Number of cells along each side of the grid
+SPACE_SUBDIVISIONS = 20
+
+
+def wrapped_move(pos, move):
+    """
+    Apply a move on the grid: the x axis wraps around and a move beyond the top or the bottom leaves y unchanged
+    :param pos: 2-tuple. Current position (x, y)
+    :param move: 2-tuple. Desired move
+    :return: 2-tuple. New position
+    """
+    pos_x = (pos[0] + move[0]) % SPACE_SUBDIVISIONS
+    pos_y = pos[1] + move[1]
+    if not 0 <= pos_y < SPACE_SUBDIVISIONS:
+        pos_y = pos[1]
+    return pos_x, pos_y
+
+
+# Every cell of the grid, indexed by [x][y]. The tables below only hold these tuples, so positions are shared
+CELLS = tuple(tuple((x, y) for y in range(SPACE_SUBDIVISIONS)) for x in range(SPACE_SUBDIVISIONS))
+
+
+def build_move_table(moves):
+    """
+    Tabulate some moves on every cell of the grid
+    :param moves: dict integer -> 2-tuple move, e.g. OBS_TO_MOVES
+    :return: tuple indexed by the integer of the move, of dicts (x, y) -> new (x, y) taken from CELLS
+    """
+    table = []
+    for i in range(len(moves)):
+        positions = {}
+        for column in CELLS:
+            for cell in column:
+                x, y = wrapped_move(cell, moves[i])
+                positions[cell] = CELLS[x][y]
+        table.append(positions)
+    return tuple(table)
+
+
+def build_cell_table(table):
+    """
+    Convert a move table to cell indices x * SPACE_SUBDIVISIONS + y
+    :param table: move table, see build_move_table
+    :return: int16 NumPy array indexed by [move, cell]
+    """
+    return np.array([[x * SPACE_SUBDIVISIONS + y for x, y in (positions[cell] for column in CELLS for cell in column)]
+                     for positions in table], dtype=np.int16)
+
+
+# Position of a fish after an observation, indexed by [observation][(x, y)]
+FISH_MOVES = build_move_table(OBS_TO_MOVES)
+# Position of a hook after an action, before checking the other hook, indexed by [action][(x, y)]
+HOOK_MOVES = build_move_table(ACT_TO_MOVES)
+# The same tables on cell indices, to move many positions at once with NumPy in mcts.py and expectimax.py
+FISH_MOVE_CELLS = build_cell_table(FISH_MOVES)
+HOOK_MOVE_CELLS = build_cell_table(HOOK_MOVES)
+
+
+def move_hook(hook, act, other_hook):
+    """
+    Position of a hook after an action. A hook cannot move to the column of the other hook.
+    :param hook: 2-tuple. Current position (x, y)
+    :param act: integer action
+    :param other_hook: 2-tuple. Position of the other hook
+    :return: 2-tuple. New position
+    """
+    new_hook = HOOK_MOVES[act][hook]
+    if new_hook[0] == other_hook[0]:
+        return CELLS[hook[0]][new_hook[1]]
+    return new_hook
+
+
+def compute_zobrist_key(state, remaining_steps):
+    """
+    Compute the Zobrist key of a state from scratch
+    :param state: a state instance
+    :param remaining_steps: number of observations left after this state
+    :return: 64-bit integer key
+    """
+    key = ZOBRIST_STEPS[remaining_steps]
+    if state.player == 1:
+        key ^= ZOBRIST_PLAYER
+    for player in range(2):
+        key ^= ZOBRIST_HOOKS[player][state.hooks[player]]
+        key ^= ZOBRIST_CAUGHT[player][state.caught[player]]
+        key ^= ZOBRIST_SCORES[player][state.scores[player]]
+    for fish_number, position in enumerate(state.fish):
+        if position is not None:
+            key ^= ZOBRIST_FISH[fish_number, position]
+    return key
+
+
+def observation_rows(observations):
+    """
+    Turn the observation sequences of the fish into one row of observations per step
+    :param observations: dict fish number -> list of observations
+    :return: list of tuples indexed by fish number, fish missing from the dict stay still
+    """
+    keys = sorted(observations.keys())
+    n_steps = len(observations[keys[0]]) if keys else 0
+    matrix = np.full((n_steps, keys[-1] + 1 if keys else 0), 8, dtype=np.int8)
+    for k in keys:
+        matrix[:, k] = observations[k]
+    return [tuple(row) for row in matrix.tolist()]
+
+
+class ObservationSequence:
+    """
+    Read-only view of the rows of a preloaded observation matrix, starting at some step. Building it does not copy
+    the rows, so that a root node can be created in constant time whatever the length of the game.
+    """
+    __slots__ = ("rows", "offset")
+
+    def __init__(self, rows, offset=0):
+        """
+        :param rows: rows of the whole game, see observation_rows
+        :param offset: number of steps already played
+        """
+        self.rows = rows
+        self.offset = offset
+
+    def __len__(self):
+        return max(len(self.rows) - self.offset, 0)
+
+    def __getitem__(self, index):
+        return self.rows[self.offset + index]
 
 
 class State:
+    """
+    Packed game state. Every field is an immutable tuple so that children can share whatever did not change
+    with their parent, and the fish scores are shared by reference between all the states of a tree.
+    """
+    __slots__ = ("player", "hooks", "fish", "scores", "caught", "fish_scores", "key")
+
     def __init__(self, number_of_fish):
         # The current player's index - 0 means MAX and 1 means MIN.
         self.player = None
-        # The player scores: {0: MAX_SCORE, 1: MIN_SCORE}
-        self.player_scores = {}
-        # The index of the caught fish for the two players in a dict.
-        # The fish index -1 means that no fish has been caught.
-        self.player_caught = {}
-        # The positions of the two hooks, provided as (x,y) coordinate tuples.
-        self.hook_positions = {}
-        # The positions of the uncaught fishes, provided as (x,y) coordinate tuples.
-        self.fish_positions = {}
-        # The score values associated with each fish index.
+        # The positions of the two hooks: ((x0, y0), (x1, y1)).
+        self.hooks = ((0, 0), (0, 0))
+        # The positions of the fish indexed by fish number, provided as (x,y) coordinate tuples.
+        # Fish that have been pulled in are None.
+        self.fish = (None,) * number_of_fish
+        # The player scores: (MAX_SCORE, MIN_SCORE)
+        self.scores = (0, 0)
+        # The index of the caught fish for the two players. The fish index -1 means that no fish has been caught.
+        self.caught = (-1, -1)
+        # The score values associated with each fish index. Shared, never copied.
         self.fish_scores = {}
+        # The Zobrist key of the state. Maintained by Node.compute_next_state, see compute_zobrist_key.
+        self.key = 0
+
+    @classmethod
+    def packed(cls, player, hooks, fish, scores, caught, fish_scores, key=0):
+        """
+        Build a state directly from its packed fields, without going through the setters
+        :param player: either 0 or 1
+        :param hooks: 2-tuple of (x, y) hook positions
+        :param fish: tuple of (x, y) fish positions indexed by fish number, None for pulled in fish
+        :param scores: 2-tuple of player scores
+        :param caught: 2-tuple of caught fish numbers, -1 when no fish is caught
+        :param fish_scores: shared mapping fish_number -> score
+        :param key: Zobrist key of the state
+        :return: new state instance
+        """
+        state = cls.__new__(cls)
+        state.player = player
+        state.hooks = hooks
+        state.fish = fish
+        state.scores = scores
+        state.caught = caught
+        state.fish_scores = fish_scores
+        state.key = key
+        return state
+
+    @property
+    def player_scores(self):
+        """
+        The player scores: {0: MAX_SCORE, 1: MIN_SCORE}
+        """
+        return {0: self.scores[0], 1: self.scores[1]}
+
+    @property
+    def player_caught(self):
+        """
+        The index of the caught fish for the two players in a dict. The fish index -1 means that no fish has been caught.
+        """
+        return {0: self.caught[0], 1: self.caught[1]}
+
+    @property
+    def hook_positions(self):
+        """
+        The positions of the two hooks, provided as (x,y) coordinate tuples.
+        """
+        return {0: self.hooks[0], 1: self.hooks[1]}
+
+    @property
+    def fish_positions(self):
+        """
+        The positions of the uncaught fishes, provided as (x,y) coordinate tuples.
+        """
+        return {i: pos for i, pos in enumerate(self.fish) if pos is not None}
 
     def set_hook_positions(self, player_pos):
         """
@@ -27,9 +244,7 @@ class State:
         :param hook_pos
         :return:
         """
-        p0 = player_pos[0], player_pos[1]
-        p1 = player_pos[2], player_pos[3]
-        self.hook_positions = {0: p0, 1: p1}
+        self.hooks = ((player_pos[0], player_pos[1]), (player_pos[2], player_pos[3]))
 
     def set_player(self, player):
         """
@@ -45,15 +260,15 @@ class State:
         :param scores:
         :return:
         """
-        self.player_scores = {0: score_p0, 1: score_p1}
+        self.scores = (score_p0, score_p1)
 
     def set_fish_scores(self, fish_scores):
         """
-        Set scores of fish
+        Set scores of fish. The mapping is shared by reference, it must not be modified afterwards.
         :param fish_scores:
         :return:
         """
-        self.fish_scores = deepcopy(fish_scores)
+        self.fish_scores = fish_scores
 
     def set_caught(self, caught):
         """
@@ -63,7 +278,7 @@ class State:
         """
         p0_caught = caught[0] if caught[0] is not None else -1
         p1_caught = caught[1] if caught[1] is not None else -1
-        self.player_caught = {0: p0_caught, 1:p1_caught}
+        self.caught = (p0_caught, p1_caught)
 
     def set_fish_positions(self, fish_number, pos):
         """
@@ -72,7 +287,11 @@ class State:
         :param pos: tuple positions in x and y
         :return:
         """
-        self.fish_positions[fish_number] = pos
+        fish = list(self.fish)
+        if fish_number >= len(fish):
+            fish.extend([None] * (fish_number + 1 - len(fish)))
+        fish[fish_number] = tuple(pos)
+        self.fish = tuple(fish)
 
     def get_hook_positions(self):
         """
@@ -93,7 +312,7 @@ class State:
         Returns the score for each player
         :return:
         """
-        return self.player_scores[0], self.player_scores[1]
+        return self.scores
 
     def get_fish_scores(self):
         """
@@ -107,13 +326,8 @@ class State:
         Return the caught fish of each player
         :return: 2-tuple with the corresponding fish_number or None for each player
         """
-        p0 = self.player_caught[0]
-        if p0 == -1:
-            p0 = None
-        p1 = self.player_caught[1]
-        if p1 == -1:
-            p1 = None
-        return p0, p1
+        p0, p1 = self.caught
+        return (p0 if p0 != -1 else None), (p1 if p1 != -1 else None)
 
     def get_fish_positions(self):
         """
@@ -124,10 +338,11 @@ class State:
 
     def __repr__(self):
         """
-        Return array visualization of the state. Meant for visualization on a debugger.
+        Return a compact visualization of the state. Meant for visualization on a debugger.
         :return: str
         """
-        return f"{self.data.tolist()}"
+        return f"State(player={self.player}, hooks={self.hooks}, fish={self.fish}, " \
+               f"scores={self.scores}, caught={self.caught})"
 
     def remove_fish(self, fish_number):
         """
@@ -135,42 +350,42 @@ class State:
         :param fish_number:
         :return:
         """
-        del self.fish_positions[fish_number]
+        fish = list(self.fish)
+        fish[fish_number] = None
+        self.fish = tuple(fish)
 
 
 def compute_caught_fish(state, current_fishes_on_rod):
     """
     Infer caught fish tuple from the state
     :param state: a state instance
+    :param current_fishes_on_rod: 2-tuple with the fish on each rod before the move (None or -1 if empty)
     :return: 2-tuple - caught fish for each player
     """
     caught_fish = [None, None]
     pull_in_fishes = [None, None]
-    hook_positions = state.get_hook_positions()
-    fish_positions = state.get_fish_positions()
-    for player_number in hook_positions:
-        if current_fishes_on_rod[player_number] is not None:
+    fish_positions = state.fish
+    for player_number, hook_position in enumerate(state.hooks):
+        fish_number = current_fishes_on_rod[player_number]
+        if fish_number is not None and fish_number != -1:
             # A fish was already attached in the previous step
-            fish_number = current_fishes_on_rod[player_number]
             if fish_positions[fish_number][1] >= 19:
                 pull_in_fishes[player_number] = fish_number
             else:
                 caught_fish[player_number] = fish_number
-        else:
+        elif hook_position in fish_positions:
             # Player did not have a fish attached to rod
-            for fish_number in fish_positions:
-                if hook_positions[player_number] == fish_positions[fish_number]:
-                    # Pull fish in if it is on the surface
-                    if fish_positions[fish_number][1] >= 19:
-                        pull_in_fishes[player_number] = fish_number
-                    else:
-                        caught_fish[player_number] = fish_number
-                    break
+            fish_number = fish_positions.index(hook_position)
+            # Pull fish in if it is on the surface
+            if hook_position[1] >= 19:
+                pull_in_fishes[player_number] = fish_number
+            else:
+                caught_fish[player_number] = fish_number
     return caught_fish, pull_in_fishes
 
 
 class Node:
-    def __init__(self, root=True, message=None, player=0):
+    def __init__(self, root=True, message=None, player=0, observations=None):
         # A list of the child Nodes, found one level below in the game tree. 
         # NOTE: this field has to be initialized by self.compute_and_get_children().
         self.children = []
@@ -188,7 +403,8 @@ class Node:
             # Initialize the following fields:
             #   self.depth (the depth level at the current node - 0 at the root)
             #   self.player (the current player's index; MAX is 0 and MIN is 1)
-            self.initialize_root(message, player)
+            # When the observations of the whole game are preloaded, the message only carries the current step
+            self.initialize_root(message, player, observations)
 
     def add_child(self, state: State, move: int, depth: int = 0, observations: dict = {}, probability: float = 1.0):
         """
@@ -200,51 +416,63 @@ class Node:
         :observations: observations of the game
         :return:
         """
+        new_node = self.create_child(state, move, depth, observations, probability)
+        self.children.append(new_node)
+        return new_node
+
+    def create_child(self, state: State, move: int, depth: int = 0, observations: dict = {}, probability: float = 1.0):
+        """
+        Create a child of current node without adding it to the children list
+        :param state: child's state
+        :param move: child's move
+        :param depth: depth of the child
+        :param observations: observations of the game
+        :param probability: probability of accessing child
+        :return: the new node
+        """
         new_node = self.__class__(root=False)
         new_node.state = state
         new_node.parent = self
         new_node.move = move
         new_node.depth = depth
         new_node.observations = observations
-        self.children.append(new_node)
-
         new_node.probability = probability
         return new_node
 
-    def initialize_root(self, curr_state, player):
+    def initialize_root(self, curr_state, player, observations=None):
         """
         Initialize root node.
         :param curr_state: parsed dict coming from game_controller
+        :param player: root's player
+        :param observations: rows of the whole game (see observation_rows), used when curr_state carries the step
+            instead of the remaining observations
         :return:
         """
 
         self.depth = 0
         self.player = player # Root's player
-        obs = curr_state["observations"]
-        keys = sorted(obs.keys())
-        obs = np.array([np.array(obs[k]) for k in keys])
-        obs = obs.T
-        obs = {i: j.tolist() for i, j in enumerate(obs)}
-        self.observations = obs
+        # One row of observations per step, indexed by fish number. Fish that are not in the message stay still.
+        if "step" in curr_state and observations is not None:
+            self.observations = ObservationSequence(observations, curr_state["step"])
+        else:
+            self.observations = observation_rows(curr_state["observations"])
+        n_fish = len(self.observations[0]) if len(self.observations) else 0
+
         # Translate message state into state object
-        curr_state_s = State(len(curr_state["fishes_positions"].keys()))
-        curr_state_s.set_player(self.player)
-        curr_state_s.set_hook_positions(
-            (*curr_state["hooks_positions"][0], *curr_state["hooks_positions"][1]))
-        curr_state_s.set_caught(
-            (curr_state["caught_fish"][0], curr_state["caught_fish"][1]))
+        fish = [None] * max(n_fish, max(curr_state["fishes_positions"].keys(), default=-1) + 1)
         for i, f in curr_state["fishes_positions"].items():
-            curr_state_s.set_fish_positions(i, f)
-
-        # Set score of players
+            fish[i] = tuple(f)
+        caught = curr_state["caught_fish"]
         player_scores = curr_state["player_scores"]
-        curr_state_s.set_player_scores(player_scores[0], player_scores[1])
-
-        # Set score, i.e. points, for fishes
-        fish_scores = curr_state["fish_scores"]
-        curr_state_s.set_fish_scores(fish_scores)
-
-        self.state = curr_state_s  # Root's state object
+        # The fish scores, i.e. points, are shared by reference with every node of the tree
+        self.state = State.packed(
+            player=self.player,
+            hooks=(tuple(curr_state["hooks_positions"][0]), tuple(curr_state["hooks_positions"][1])),
+            fish=tuple(fish),
+            scores=(player_scores[0], player_scores[1]),
+            caught=(caught[0] if caught[0] is not None else -1, caught[1] if caught[1] is not None else -1),
+            fish_scores=curr_state["fish_scores"])
+        self.state.key = compute_zobrist_key(self.state, len(self.observations))
 
     def compute_and_get_children(self):
         """
@@ -259,130 +487,392 @@ class Node:
         if len(self.children) != 0: # If we already compute the children 
             return self.children 
 
-        current_player = self.state.get_player()
-        caught = self.state.get_caught()
-        if caught[current_player] is not None:
+        state = self.state
+        observations = self.observations[self.depth]
+        # The fish move the same way whatever the action, so they are advanced once for all the children
+        advanced_fish = self.advance_fish_and_key(state, observations)
+        if state.caught[state.player] != -1:
             # Next action is always up for the current player
-            new_state = self.compute_next_state(self.state, 1, self.observations[self.depth])
-            self.add_child(new_state, 1, self.depth+1, self.observations)
+            self.add_child(self.compute_next_state(state, 1, observations, advanced_fish), 1, self.depth+1,
+                           self.observations)
         else:
             # Any action is possible
             for act in range(5):
-                new_state = self.compute_next_state(
-                    self.state, act, self.observations[self.depth])
-                self.add_child(new_state, act, self.depth+1, self.observations)
+                self.add_child(self.compute_next_state(state, act, observations, advanced_fish), act, self.depth+1,
+                               self.observations)
 
         return self.children
 
-    def compute_next_state(self, current_state, act, observations):
+    def legal_moves(self):
+        """
+        Moves that can be played from this node, without computing the children
+        :return: list of integer actions, empty when there are no observations left
+        """
+        if len(self.observations) == self.depth:
+            return []
+        if self.state.caught[self.state.player] != -1:
+            # Next action is always up for the current player
+            return [1]
+        return [0, 1, 2, 3, 4]
+
+    def expand(self, moves=None, keep=True):
+        """
+        Generate the children one at a time, in the order of the given moves. A child is only computed when the
+        generator gets to it, so the children after an alpha-beta cutoff are never computed.
+        :param moves: legal moves to generate, by default every legal move
+        :param keep: store the children in self.children as compute_and_get_children does. Without it the children are
+            only referenced by the caller: a depth-first search then holds one path of nodes at a time, and every
+            subtree is freed as soon as it has been searched.
+        :return: generator of children nodes
+        """
+        if moves is None:
+            moves = self.legal_moves()
+        if keep or len(self.children) != 0:
+            children = {child.move: child for child in self.compute_and_get_children()}
+            for move in moves:
+                yield children[move]
+            return
+
+        state = self.state
+        observations = self.observations[self.depth]
+        advanced_fish = None
+        for move in moves:
+            if advanced_fish is None:
+                # The fish move the same way whatever the action
+                advanced_fish = self.advance_fish_and_key(state, observations)
+            yield self.create_child(self.compute_next_state(state, move, observations, advanced_fish), move,
+                                    self.depth+1, self.observations)
+
+    def get_child(self, move):
+        """
+        Child reached by a move, computed if it is not stored in self.children
+        :param move: legal move
+        :return: child node
+        """
+        return next(self.expand([move], keep=False))
+
+    def advance_fish_and_key(self, current_state, observations):
+        """
+        Move every fish of a state one step and update its Zobrist key for the fish, the player and the step
+        :param current_state: current state object instance
+        :param observations: observations of the fish for the current step, indexed by fish number
+        :return: 2-tuple with the new fish positions and the new key, before the hook of the player moves
+        """
+        old_fish = current_state.fish
+        fish = self.advance_fish(old_fish, observations, current_state.player, current_state.caught)
+
+        # Update the Zobrist key incrementally: switch player and step, then xor out what moved and xor in where it went
+        remaining_steps = len(self.observations) - self.depth
+        key = current_state.key ^ ZOBRIST_PLAYER ^ ZOBRIST_STEPS[remaining_steps] ^ ZOBRIST_STEPS[remaining_steps - 1]
+        for fish_number, position in enumerate(fish):
+            old_position = old_fish[fish_number]
+            if position != old_position:
+                key ^= ZOBRIST_FISH[fish_number, old_position] ^ ZOBRIST_FISH[fish_number, position]
+        return fish, key
+
+    def compute_next_state(self, current_state, act, observations, advanced_fish=None):
         """
         Given a state and an action, compute the next state. Add the next observations as well.
         :param current_state: current state object instance
         :param act: integer of the move
-        :param observations: list of observations for current fish
+        :param observations: observations of the fish for the current step, indexed by fish number
+        :param advanced_fish: result of advance_fish_and_key for the same state and observations, if already known
         :return:
         """
-        current_player = current_state.get_player()
-        next_player = 1 - current_player
-        fish_states = current_state.get_fish_positions()
-        hook_states = current_state.get_hook_positions()
-        new_state = State(len(fish_states.keys()))
-        new_state.set_player(next_player)
-        current_fishes_on_rod = current_state.get_caught()
-        self.compute_new_fish_states(new_state, fish_states, observations, current_player, fishes_on_rod=current_fishes_on_rod)
-        new_hook_positions = self.compute_new_hook_states(
-            hook_states, current_player, ACT_TO_MOVES[act])
-        new_state.set_hook_positions(new_hook_positions)
+        current_player = current_state.player
+        caught = current_state.caught
+        if advanced_fish is None:
+            advanced_fish = self.advance_fish_and_key(current_state, observations)
+        fish, key = advanced_fish
 
-        # Get player scores for new state
-        score_p0, score_p1 = current_state.get_player_scores()
+        # Only the hook of the current player moves
+        old_hooks = current_state.hooks
+        if current_player == 0:
+            hooks = (move_hook(old_hooks[0], act, old_hooks[1]), old_hooks[1])
+        else:
+            hooks = (old_hooks[0], move_hook(old_hooks[1], act, old_hooks[0]))
+        if hooks[current_player] != old_hooks[current_player]:
+            hook_keys = ZOBRIST_HOOKS[current_player]
+            key ^= hook_keys[old_hooks[current_player]] ^ hook_keys[hooks[current_player]]
 
-        # Set fish scores for new state
-        new_state.set_fish_scores(current_state.get_fish_scores())
+        scores = current_state.scores
+        fish_scores = current_state.fish_scores
+        new_state = State.packed(1 - current_player, hooks, fish, scores, caught, fish_scores)
 
         # Compute the fish that are currently caught by players
-        next_caught_fish, pull_in_fishes = compute_caught_fish(new_state, current_fishes_on_rod)
+        next_caught_fish, pull_in_fishes = compute_caught_fish(new_state, caught)
 
         # Update player scores and remove fishes that are caught and at the surface
-        fish_score_points = new_state.get_fish_scores()
-        for i_player, fish_number in enumerate(pull_in_fishes):
-            if fish_number is not None:
-                if i_player == 0:
-                    score_p0 += fish_score_points[fish_number]
-                else:
-                    score_p1 += fish_score_points[fish_number]
-
-                # Remove fish
-                new_state.remove_fish(fish_number)
-
-        # Update players scores
-        new_state.set_player_scores(score_p0, score_p1)
-
-        new_state.set_caught(next_caught_fish)
+        if pull_in_fishes[0] is not None or pull_in_fishes[1] is not None:
+            score_p0, score_p1 = scores
+            fish = list(fish)
+            for i_player, fish_number in enumerate(pull_in_fishes):
+                if fish_number is not None:
+                    if i_player == 0:
+                        score_p0 += fish_scores[fish_number]
+                    else:
+                        score_p1 += fish_scores[fish_number]
+                    # Remove fish
+                    key ^= ZOBRIST_FISH[fish_number, fish[fish_number]]
+                    fish[fish_number] = None
+            new_state.fish = tuple(fish)
+            new_state.scores = (score_p0, score_p1)
+            for i_player in range(2):
+                if new_state.scores[i_player] != scores[i_player]:
+                    score_keys = ZOBRIST_SCORES[i_player]
+                    key ^= score_keys[scores[i_player]] ^ score_keys[new_state.scores[i_player]]
+
+        new_caught = (next_caught_fish[0] if next_caught_fish[0] is not None else -1,
+                      next_caught_fish[1] if next_caught_fish[1] is not None else -1)
+        if new_caught != caught:
+            for i_player in range(2):
+                if new_caught[i_player] != caught[i_player]:
+                    caught_keys = ZOBRIST_CAUGHT[i_player]
+                    key ^= caught_keys[caught[i_player]] ^ caught_keys[new_caught[i_player]]
+        new_state.caught = new_caught
+        new_state.key = key
 
         return new_state
 
-    def compute_new_hook_states(self, current_hook_states, current_player, move):
+    def advance_fish(self, fish, observations, current_player, caught):
         """
-        Compute the hook states after a certain move
-        :param current_hook_states: 4-iterable with (x, y) positions of player 0's hook and (x, y) of player 1's hook
+        Move every fish one step according to the observations
+        :param fish: tuple of (x, y) fish positions indexed by fish number, None for pulled in fish
+        :param observations: observations of the fish for the current step, indexed by fish number
         :param current_player: either 0 or 1
-        :param move: integer. current_player's action
-        :return: 4 elements list with new (x, y) positions of player 0's hook and (x, y) of player 1's hook
-        """
-        new_hook_states = [0, 0, 0, 0]
-        next_player = 1 - current_player
-
-        hook_position_next_player = current_hook_states[next_player]
-        new_hook_states[next_player * 2] = hook_position_next_player[0]
-        new_hook_states[next_player * 2 + 1] = hook_position_next_player[1]
-
-        hook_position_current_player = self.xy_move(
-            current_hook_states[current_player], move, current_hook_states[next_player])
-        new_hook_states[current_player * 2] = hook_position_current_player[0]
-        new_hook_states[current_player * 2 +
-                        1] = hook_position_current_player[1]
+        :param caught: 2-tuple of caught fish numbers, -1 when no fish is caught
+        :return: tuple with the new fish positions
+        """
+        new_fish = [None if pos is None else FISH_MOVES[obs][pos] for pos, obs in zip(fish, observations)]
+        on_own_rod = caught[current_player]
+        if on_own_rod != -1:
+            # Fishes on rod of current player can only move up
+            new_fish[on_own_rod] = FISH_MOVES[0][fish[on_own_rod]]
+        on_other_rod = caught[1 - current_player]
+        if on_other_rod != -1:
+            # Fishes on rod of other player do not move
+            new_fish[on_other_rod] = fish[on_other_rod]
+        return tuple(new_fish)
+
+
+class FishTrajectories:
+    """
+    Positions of the free fish, i.e. neither caught nor pulled in, at every step of a search. A free fish follows its
+    observations whatever the players do until it is caught, so its positions are the same in every node and are
+    computed only once per step.
+    """
 
-        return new_hook_states
+    def __init__(self, nodes):
+        """
+        :param nodes: nodes at the same depth of one game tree, e.g. the root. The fish free in any of them are tracked.
+        """
+        self.observations = nodes[0].observations
+        self.first_step = nodes[0].depth
+        fish = [None] * max(len(node.state.fish) for node in nodes)
+        for node in nodes:
+            state = node.state
+            for fish_number, position in enumerate(state.fish):
+                if position is not None and fish_number not in state.caught:
+                    fish[fish_number] = position
+        # Whether each fish is tracked
+        self.tracked = tuple(position is not None for position in fish)
+        # Positions of the tracked fish at every step from first_step, None for the other fish
+        self.positions = [tuple(fish)]
+        # Keys of the move of every tracked fish from each step to the next one, see ZOBRIST_FISH
+        self.fish_keys = []
+        # The keys of the moves of all the tracked fish xor-ed together, for each step
+        self.step_keys = []
+
+    def extend(self, step):
+        """
+        Compute the positions up to some step
+        :param step: depth in the game tree, at most the number of observations
+        :return:
+        """
+        positions = self.positions
+        while len(positions) <= step - self.first_step:
+            fish = positions[-1]
+            observations = self.observations[self.first_step + len(positions) - 1]
+            new_fish = tuple(None if position is None else FISH_MOVES[observations[fish_number]][position]
+                             for fish_number, position in enumerate(fish))
+            fish_keys = tuple(0 if position == new_position else
+                              ZOBRIST_FISH[fish_number, position] ^ ZOBRIST_FISH[fish_number, new_position]
+                              for fish_number, (position, new_position) in enumerate(zip(fish, new_fish)))
+            step_key = 0
+            for fish_key in fish_keys:
+                step_key ^= fish_key
+            positions.append(new_fish)
+            self.fish_keys.append(fish_keys)
+            self.step_keys.append(step_key)
+
+
+class SearchState:
+    """
+    Mutable game state for deep searches. apply(move) plays a move in place and pushes what it changed on an undo
+    stack, undo() takes the last move back. Neither nodes nor states are created per move: the free fish are read
+    from shared FishTrajectories, and only the hooks, the fish on the rods and the scores are updated. The fields
+    read by the evaluation (player, hooks, fish, scores, caught, fish_scores, key) match those of State, and the key
+    is the one Node.compute_next_state would give.
+    """
+    __slots__ = ("player", "step", "n_steps", "hooks", "caught", "caught_positions", "scores", "fish_scores",
+                 "removed", "key", "trajectories", "undo_stack")
+
+    def __init__(self, node, trajectories):
+        """
+        :param node: node to start from
+        :param trajectories: FishTrajectories of the same game tree, at the depth of the node or above it
+        """
+        state = node.state
+        self.player = state.player
+        # Depth in the game tree, i.e. index of the next observations
+        self.step = node.depth
+        self.n_steps = len(node.observations)
+        self.hooks = list(state.hooks)
+        self.caught = list(state.caught)
+        # Positions of the fish on the rods, None for an empty rod
+        self.caught_positions = [None if fish_number == -1 else state.fish[fish_number] for fish_number in state.caught]
+        self.scores = list(state.scores)
+        self.fish_scores = state.fish_scores
+        # Pulled in fish whose trajectory is still computed, and the fish pulled in by the moves applied since
+        self.removed = [fish_number for fish_number, tracked in enumerate(trajectories.tracked)
+                        if tracked and state.fish[fish_number] is None]
+        self.key = state.key
+        self.trajectories = trajectories
+        # One record of the replaced values per applied move
+        self.undo_stack = []
+        trajectories.extend(self.step)
+
+    @property
+    def fish(self):
+        positions = self.trajectories.positions[self.step - self.trajectories.first_step]
+        caught = self.caught
+        if len(self.removed) == 0 and caught[0] == -1 and caught[1] == -1:
+            return positions
+        fish = list(positions)
+        for fish_number in self.removed:
+            fish[fish_number] = None
+        for fish_number, position in zip(caught, self.caught_positions):
+            if fish_number != -1:
+                fish[fish_number] = position
+        return fish
+
+    def legal_moves(self):
+        """
+        Moves the player to move can play
+        :return: list of integer actions, empty when there are no observations left
+        """
+        if self.step == self.n_steps:
+            return []
+        if self.caught[self.player] != -1:
+            # Next action is always up for the current player
+            return [1]
+        return [0, 1, 2, 3, 4]
 
-    def compute_new_fish_states(self, new_state, current_fish_positions, observations, current_player, fishes_on_rod=None):
+    def apply(self, move):
         """
-        Compute the new fish states given the observations
-        :param new_state: state instance where to save the new fish positions
-        :param current_fish_positions: map: fish_number -> (x, y) position of the fish
-        :param observations: list of observations, in the order of the sorted keys of the remaining fishes
+        Play a move in place: the hook of the player to move, then every fish, then the fish caught and pulled in,
+        as Node.compute_next_state does
+        :param move: legal integer action of the player to move
         :return:
         """
-        for i, k in enumerate(sorted(current_fish_positions.keys())):
-
-            if fishes_on_rod[current_player] == k:
-                # Fishes on rod of current player can only move up
-                new_fish_obs_code = OBS_TO_MOVES[0]
-            elif fishes_on_rod[1-current_player] == k:
-                # Fishes on rod of other player do not move
-                new_fish_obs_code = (0,0)
+        player = self.player
+        hooks = self.hooks
+        caught = self.caught
+        caught_positions = self.caught_positions
+        scores = self.scores
+        removed = self.removed
+        trajectories = self.trajectories
+        self.undo_stack.append((self.key, hooks[player], caught[0], caught[1], caught_positions[0],
+                                caught_positions[1], scores[0], scores[1], len(removed)))
+
+        step = self.step
+        index = step - trajectories.first_step
+        if index + 1 >= len(trajectories.positions):
+            trajectories.extend(step + 1)
+        remaining_steps = self.n_steps - step
+        # Move every tracked fish, then take back the moves of those that are not free any more
+        key = (self.key ^ ZOBRIST_PLAYER ^ ZOBRIST_STEPS[remaining_steps] ^ ZOBRIST_STEPS[remaining_steps - 1]
+               ^ trajectories.step_keys[index])
+        if removed or caught[0] != -1 or caught[1] != -1:
+            tracked = trajectories.tracked
+            fish_keys = trajectories.fish_keys[index]
+            for fish_number in removed:
+                if tracked[fish_number]:
+                    key ^= fish_keys[fish_number]
+            for fish_number in caught:
+                if fish_number != -1 and tracked[fish_number]:
+                    key ^= fish_keys[fish_number]
+
+        # Fishes on rod of current player can only move up, fishes on rod of other player do not move
+        fish_number = caught[player]
+        if fish_number != -1:
+            position = caught_positions[player]
+            new_position = FISH_MOVES[0][position]
+            if new_position != position:
+                key ^= ZOBRIST_FISH[fish_number, position] ^ ZOBRIST_FISH[fish_number, new_position]
+                caught_positions[player] = new_position
+
+        # Only the hook of the current player moves
+        hook = hooks[player]
+        new_hook = move_hook(hook, move, hooks[1 - player])
+        if new_hook != hook:
+            hook_keys = ZOBRIST_HOOKS[player]
+            key ^= hook_keys[hook] ^ hook_keys[new_hook]
+            hooks[player] = new_hook
+
+        # Fish caught and pulled in, see compute_caught_fish
+        positions = trajectories.positions[index + 1]
+        for i_player in range(2):
+            fish_number = caught[i_player]
+            if fish_number != -1:
+                position = caught_positions[i_player]
+                if position[1] < 19:
+                    continue
             else:
-                obs = observations[i]
-                new_fish_obs_code = OBS_TO_MOVES[obs]
-
-            curr_pos = current_fish_positions[k]
-            new_state.set_fish_positions(k, self.xy_move(curr_pos, new_fish_obs_code))
-
-    def xy_move(self, pos, move, adv_pos = None):
-        """
-        Return the (x, y) position after a given move of the tuple pos. Wraps the x axis so that trespassing the right
-        margin means appearing in the left and vice versa. Makes sure the hooks cannot cross each other.
-        :param pos: 2-tuple. Current position (x, y)
-        :param move: 2-tuple. Desired move.
-        :return: 2-tuple. pos + move corrected to be in the margins [0, space_subdivisions)
-        """
-        space_subdivisions = 20
-        pos_x = (pos[0] + move[0] + space_subdivisions) % space_subdivisions
-        pos_y = pos[1] + move[1]
-        if not 0 <= pos_y < space_subdivisions:
-            pos_y = pos[1]
-        if adv_pos is not None:
-            if pos_x == adv_pos[0]:
-                return pos[0], pos_y
-
-        return pos_x, pos_y
+                hook = hooks[i_player]
+                if hook not in positions:
+                    continue
+                fish_number = -1
+                for k, position in enumerate(positions):
+                    if position == hook and k not in removed and k != caught[0] and k != caught[1]:
+                        fish_number = k
+                        break
+                if fish_number == -1:
+                    continue
+                if hook[1] < 19:
+                    caught_keys = ZOBRIST_CAUGHT[i_player]
+                    key ^= caught_keys[-1] ^ caught_keys[fish_number]
+                    caught[i_player] = fish_number
+                    caught_positions[i_player] = hook
+                    continue
+            # Pull the fish in: update the score of the player and remove the fish
+            key ^= ZOBRIST_FISH[fish_number, position]
+            score_keys = ZOBRIST_SCORES[i_player]
+            score = scores[i_player] + self.fish_scores[fish_number]
+            key ^= score_keys[scores[i_player]] ^ score_keys[score]
+            scores[i_player] = score
+            if caught[i_player] != -1:
+                caught_keys = ZOBRIST_CAUGHT[i_player]
+                key ^= caught_keys[fish_number] ^ caught_keys[-1]
+                caught[i_player] = -1
+                caught_positions[i_player] = None
+            removed.append(fish_number)
+
+        self.key = key
+        self.player = 1 - player
+        self.step = step + 1
+
+    def undo(self):
+        """
+        Take back the last applied move
+        :return:
+        """
+        key, hook, caught_0, caught_1, position_0, position_1, score_0, score_1, n_removed = self.undo_stack.pop()
+        self.step -= 1
+        self.player = player = 1 - self.player
+        self.key = key
+        self.hooks[player] = hook
+        self.caught[0], self.caught[1] = caught_0, caught_1
+        self.caught_positions[0], self.caught_positions[1] = position_0, position_1
+        self.scores[0], self.scores[1] = score_0, score_1
+        del self.removed[n_removed:]
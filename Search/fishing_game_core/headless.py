@@ -0,0 +1,223 @@
+import random
+import time
+
+import numpy as np
+
+from fishing_game_core.game_tree import Node, State, observation_rows
+from fishing_game_core.sequences import Sequences
+from fishing_game_core.shared import ACTION_TO_STR, TYPE_TO_SCORE
+
+STR_TO_ACTION = {value: key for key, value in ACTION_TO_STR.items()}
+
+
+class LocalOpponent:
+    """
+    Stand-in for the opponent's MinimaxModel that runs anywhere: a shallow minimax from the point of view of player 1
+    (MIN) with a simple greedy heuristic. Ties are broken with its own random generator.
+    """
+
+    def __init__(self, initial_data=None, space_subdivisions=20, depth=2, seed=None):
+        self.space_subdivisions = space_subdivisions
+        self.depth = depth
+        self.random = random.Random(seed)
+
+    def heuristic(self, node):
+        """
+        Value of a node for player 0: score difference plus the most attractive fish of each player
+        :param node: game tree node
+        :return: float
+        """
+        state = node.state
+        value = state.scores[0] - state.scores[1]
+        best = [0.0, 0.0]
+        for fish_number, position in enumerate(state.fish):
+            if position is None:
+                continue
+            score = state.fish_scores[fish_number]
+            for player, hook in enumerate(state.hooks):
+                dx = abs(position[0] - hook[0])
+                distance = min(dx, self.space_subdivisions - dx) + abs(position[1] - hook[1])
+                best[player] = max(best[player], score / (1.0 + distance))
+        return value + best[0] - best[1]
+
+    def minimax(self, node, depth):
+        children = node.compute_and_get_children() if depth > 0 else []
+        if len(children) == 0:
+            return self.heuristic(node)
+        values = [self.minimax(child, depth - 1) for child in children]
+        return max(values) if node.state.player == 0 else min(values)
+
+    def next_move(self, initial_tree_node):
+        """
+        Compute the next move of player 1
+        :param initial_tree_node: root node, with player 1 to move
+        :return: either "stay", "left", "right", "up" or "down"
+        """
+        children = initial_tree_node.compute_and_get_children()
+        if len(children) == 0:
+            return "stay"
+        values = [self.minimax(child, self.depth - 1) for child in children]
+        best_value = min(values)
+        best_moves = [child.move for child, value in zip(children, values) if value == best_value]
+        return ACTION_TO_STR[self.random.choice(best_moves)]
+
+
+class HeadlessFishingDerby:
+    """
+    Kivy-free fishing derby for two players, built on the game tree. The turns follow FishingDerbyMinimaxApp: the fish
+    move once before the first decision, the players then alternate starting with player 1, and every decision is
+    followed by one move of every fish. Games run as fast as the players answer.
+    """
+
+    def __init__(self, observations_sequence, time_threshold=75e-3):
+        """
+        :param observations_sequence: scenario, as loaded by Sequences
+        :param time_threshold: seconds player 0 has to answer, see FishingDerbyMinimaxApp.check_time_threshold
+        """
+        self.observations_sequence = observations_sequence
+        self.time_threshold = time_threshold
+        sequence = observations_sequence["sequence"]
+        self.n_fish = len(observations_sequence["init_fishes"])
+        self.sequences = {i: sequence[str(i)] for i in range(self.n_fish)}
+        self.n_seq = observations_sequence["params"]["n_seq"]
+        self.fish_scores = {i: observations_sequence["init_fishes"][str(i)]["score"] for i in range(self.n_fish)}
+        # Observations of the whole game, shared by every root node the game builds
+        self.observation_rows = observation_rows(self.sequences)
+
+    @classmethod
+    def from_file(cls, filename, **kwargs):
+        """
+        Load a scenario from an observations file
+        :param filename: path to the observations file
+        :return: new game instance
+        """
+        return cls(Sequences().load(filename).data, **kwargs)
+
+    def first_message(self):
+        """
+        Message sent to player 0 before the first turn, as in FishingDerbyMinimaxApp.send_first_message with
+        compact observations
+        :return: dict
+        """
+        msg = {}
+        for i in range(self.n_fish):
+            score = self.fish_scores[i]
+            type_fish = next(key for key, value in TYPE_TO_SCORE.items() if value == score)
+            msg["fish" + str(i)] = {"type": type_fish, "score": score}
+        msg["observations"] = dict(self.sequences)
+        msg["game_over"] = False
+        return msg
+
+    def initial_state(self):
+        """
+        State of the game before the fish make their first move
+        :return: state instance with player 0 to move
+        """
+        init_players = self.observations_sequence["init_players"]
+        init_fishes = self.observations_sequence["init_fishes"]
+        return State.packed(
+            player=0,
+            hooks=tuple(tuple(init_players[str(i)]) for i in range(2)),
+            fish=tuple(tuple(init_fishes[str(i)]["init_pos"]) for i in range(self.n_fish)),
+            scores=(0, 0),
+            caught=(-1, -1),
+            fish_scores=self.fish_scores)
+
+    def build_message(self, state, step, compact=False):
+        """
+        Message describing the state, as in FishingDerbyMinimaxApp.build_minimax_msg
+        :param state: current state
+        :param step: number of fish moves already played
+        :param compact: put the step instead of the remaining observations
+        :return: dict
+        """
+        msg = {"game_over": False, "hooks_positions": {0: state.hooks[0], 1: state.hooks[1]},
+               "fishes_positions": {}, "observations": {}, "fish_scores": {}}
+        for fish_number, position in enumerate(state.fish):
+            if position is not None:
+                msg["fishes_positions"][fish_number] = position
+                if not compact:
+                    msg["observations"][fish_number] = self.sequences[fish_number][step:]
+                msg["fish_scores"][fish_number] = self.fish_scores[fish_number]
+        msg["player_scores"] = {0: state.scores[0], 1: state.scores[1]}
+        msg["caught_fish"] = {p: (c if c != -1 else None) for p, c in enumerate(state.caught)}
+        if compact:
+            msg["step"] = step
+        return msg
+
+    def root(self, state, step):
+        """
+        Root node of the game tree at some step, built from the preloaded observations
+        :param state: current state
+        :param step: number of fish moves already played
+        :return: node instance
+        """
+        return Node(message=self.build_message(state, step, compact=True), player=state.player,
+                    observations=self.observation_rows)
+
+    def advance(self, state, step, act):
+        """
+        Play one turn: move the hook of the player to move and every fish
+        :param state: current state
+        :param step: number of fish moves already played
+        :param act: integer action of the player to move
+        :return: next state
+        """
+        node = self.root(state, step)
+        return node.compute_next_state(node.state, act, node.observations[0])
+
+    def play(self, player_controller, opponent, seed=None, stop_on_timeout=True, on_move=None):
+        """
+        Play a full game
+        :param player_controller: PlayerControllerMinimax (or compatible) playing as player 0
+        :param opponent: object with a next_move(node) method playing as player 1, e.g. LocalOpponent
+        :param seed: seed of the random generators, as in FishingDerbyMinimaxApp.set_seed
+        :param stop_on_timeout: end the game when player 0 times out 3 times in a row, as the app does
+        :param on_move: optional callable receiving the record of every move
+        :return: dict with the final scores, the number of timeouts and the record of every move
+        """
+        if seed is not None:
+            random.seed(seed)
+            np.random.seed(seed)
+
+        # The fish move once while player 0 stays, before the first decision
+        state = self.advance(self.initial_state(), 0, 0)
+        step = 1
+        moves = []
+        n_timeouts = 0
+        consecutive_timeouts = 0
+        timed_out = False
+        while step < self.n_seq and any(position is not None for position in state.fish):
+            player = state.player
+            node = self.root(state, step)
+            start = time.perf_counter()
+            if player == 0:
+                action = player_controller.search_best_next_move(initial_tree_node=node)
+            else:
+                action = opponent.next_move(node)
+            search_time = time.perf_counter() - start
+
+            record = {"step": step, "player": player, "action": action, "time": search_time,
+                      "depth": getattr(player_controller, "search_depth", None) if player == 0 else None}
+            if player == 0:
+                if search_time > self.time_threshold:
+                    n_timeouts += 1
+                    consecutive_timeouts += 1
+                else:
+                    consecutive_timeouts = 0
+
+            # A player with a fish on the rod can only pull it up
+            act = 1 if state.caught[player] != -1 else STR_TO_ACTION[action]
+            state = node.compute_next_state(node.state, act, node.observations[0])
+            step += 1
+            record["score_p0"], record["score_p1"] = state.scores
+            moves.append(record)
+            if on_move is not None:
+                on_move(record)
+
+            if consecutive_timeouts >= 3 and stop_on_timeout:
+                timed_out = True
+                break
+
+        return {"score_p0": state.scores[0], "score_p1": state.scores[1], "n_timeouts": n_timeouts,
+                "timed_out": timed_out, "moves": moves}
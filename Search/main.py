@@ -3,9 +3,10 @@ import multiprocessing as mp
 import sys
 
 import yaml
-from kivy.config import Config
 
+from fishing_game_core.communicator import SharedMemoryChannel
 from fishing_game_core.shared import SettingLoader
+from player_process import run_player
 
 
 class Settings:
@@ -24,6 +25,23 @@ class Settings:
         self.space_subdivisions = 20
         # Number of frames before an action is executed
         self.frames_per_action = 10
+        # Number of worker processes searching the root moves in parallel. 0 searches in the player process only.
+        self.search_workers = 0
+        # Send the observation sequences once in the first message, the next messages only carry the current step.
+        # Off by default: the messages then have the original shape that any player expects.
+        self.compact_observations = False
+        # File of the book of the positions searched in previous games, None to disable it
+        self.position_book = None
+        # Search of the minimax player, either 'minimax', 'expectimax' or 'mcts'
+        self.search_mode = "minimax"
+        # Number of steps of fish observations the expectimax search trusts, the fish moves past them are random
+        self.observation_horizon = 20
+        # File the profile of the search of every game is appended to, None to disable profiling
+        self.profile_log = None
+        # Send the messages of every turn through shared memory instead of pickling them through the pipes
+        self.shared_memory = False
+        # Start method of the player process, 'fork', 'forkserver' or 'spawn'. None uses the default of the platform.
+        self.start_method = None
 
     def load_from_dict(self, dictionary):
         """
@@ -33,6 +51,14 @@ class Settings:
         """
         self.observations_file = dictionary.get("observations_file")
         self.player_type = dictionary.get("player_type", "human")
+        self.search_workers = dictionary.get("search_workers", 0)
+        self.compact_observations = dictionary.get("compact_observations", False)
+        self.position_book = dictionary.get("position_book")
+        self.search_mode = dictionary.get("search_mode", "minimax")
+        self.observation_horizon = dictionary.get("observation_horizon", 20)
+        self.profile_log = dictionary.get("profile_log")
+        self.shared_memory = dictionary.get("shared_memory", False)
+        self.start_method = dictionary.get("start_method")
 
 
 class Application(SettingLoader):
@@ -41,12 +67,13 @@ class Application(SettingLoader):
 
         # Declaration of class objects
         self.game_controller = None
-        self.player_controller = None
         self.settings = None
         self.game_pipe_send = None
         self.game_pipe_receive = None
         self.player_pipe_receive = None
         self.player_pipe_send = None
+        self.game_to_player_channel = None
+        self.player_to_game_channel = None
         self.player_loop = None
 
     def start(self):
@@ -54,31 +81,49 @@ class Application(SettingLoader):
         Start game and player processes
         :return:
         """
+        # Start the player process before Kivy and the game app are imported, so that it does not inherit them
+        self.select_and_launch_player_loop()
+
         # Initialize game process
+        self.configure_window()
         self.game_controller = self.get_app()
         self.game_controller.load_settings(self.settings)
         self.game_controller.set_receive_send_pipes(
             self.game_pipe_receive, self.game_pipe_send)
-
-        # Initialize player process
-        self.player_controller = self.get_player_controller()
-        self.player_controller.load_settings(self.settings)
-        self.player_controller.set_receive_send_pipes(self.player_pipe_receive, self.player_pipe_send)
-
-        # Set player loop to use
-        self.select_and_launch_player_loop()
+        if self.game_to_player_channel is not None:
+            self.game_controller.set_receive_send_channels(self.player_to_game_channel, self.game_to_player_channel)
         if self.settings.player_type == 'ai_minimax':
             self.game_controller.set_seed(120283473)
         self.start_game()
 
     def select_and_launch_player_loop(self):
+        # The player controller is created in the player process, from an entry point that only imports the player
+        context = mp.get_context(self.settings.start_method)
+        if context.get_start_method() == "forkserver":
+            context.set_forkserver_preload(["player"])
+        channels = None
+        if self.game_to_player_channel is not None:
+            channels = (self.game_to_player_channel, self.player_to_game_channel)
+
         # Create process
-        self.player_loop = mp.Process(
-            target=self.player_controller.player_loop)
+        self.player_loop = context.Process(
+            target=run_player,
+            args=(self.settings, (self.player_pipe_receive, self.player_pipe_send), channels))
 
         # Start process
         self.player_loop.start()
 
+    def configure_window(self):
+        """
+        Set the window dimensions. Kivy is only imported here so that headless tools and the player process do not
+        import it.
+        :return:
+        """
+        from kivy.config import Config
+        Config.set('graphics', 'resizable', False)
+        Config.set('graphics', 'width', str(int(self.settings.window_scale * 800)))
+        Config.set('graphics', 'height', str(int(self.settings.window_scale * 600)))
+
     def get_app(self):
         player_type = self.settings.player_type
         if player_type == "human":
@@ -114,18 +159,11 @@ class Application(SettingLoader):
         """
         self.game_pipe_send, self.player_pipe_receive = mp.Pipe()
         self.player_pipe_send, self.game_pipe_receive = mp.Pipe()
-
-    def get_player_controller(self):
-        if self.settings.player_type == "ai_minimax":
-            from player import PlayerControllerMinimax
-            pc = PlayerControllerMinimax()
-        elif self.settings.player_type == "human":
-            from player import PlayerControllerHuman
-            pc = PlayerControllerHuman()
-        else:
-            raise AttributeError(
-                "Parameter " + self.settings.player_type + " not understood")
-        return pc
+        if self.settings.shared_memory:
+            # The messages of every turn go through the channels, the pipes only carry the other messages
+            context = mp.get_context(self.settings.start_method)
+            self.game_to_player_channel = SharedMemoryChannel(context=context)
+            self.player_to_game_channel = SharedMemoryChannel(context=context)
 
 
 if __name__ == '__main__':
@@ -141,11 +179,6 @@ if __name__ == '__main__':
     settings_dictionary = yaml.safe_load(open(args.config_file, 'r'))
     settings.load_from_dict(settings_dictionary)
 
-    # Set window dimensions
-    Config.set('graphics', 'resizable', False)
-    Config.set('graphics', 'width', str(int(settings.window_scale * 800)))
-    Config.set('graphics', 'height', str(int(settings.window_scale * 600)))
-
     # Start application
     app = Application()
     app.load_settings(settings)
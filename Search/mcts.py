@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+import math
+import multiprocessing as mp
+import time
+
+import numpy as np
+
+from expectimax import CLOSENESS
+from fishing_game_core.game_tree import FISH_MOVE_CELLS, HOOK_MOVE_CELLS, SPACE_SUBDIVISIONS, ObservationSequence
+from root_parallel import RESULT_MARGIN
+
+# Number of random playouts run at once from every new leaf
+ROLLOUTS = 32
+# Plies played by every playout before the position is evaluated
+ROLLOUT_PLIES = 12
+# Exploration constant of UCT, for values scaled to [-1, 1]
+UCT_EXPLORATION = 0.7
+# Leaves collected per worker before their playouts are sent to the pool
+LEAVES_PER_WORKER = 2
+# Row of the surface, where the fish on a rod are pulled in
+SURFACE = 19
+
+# Per-process state of the workers, set by init_worker
+_observation_rows = None
+
+
+def rollouts(hooks, caught, scores, player, fish, observations, fish_scores, n_rollouts, final, seed=None):
+    """
+    Random playouts from a state, all played at once on arrays of cell indices with the move tables of the game tree.
+    The rules are those of Node.compute_next_state. A fish on a rod is always on the hook of its player, so it is not
+    tracked separately.
+    :param hooks: 2-tuple of the positions of the hooks
+    :param caught: 2-tuple with the fish on each rod, -1 for an empty rod
+    :param scores: 2-tuple of the scores
+    :param player: player to move
+    :param fish: positions of the fish, None for the pulled in fish
+    :param observations: integer NumPy array of the observations of the next steps, shape (steps, fish)
+    :param fish_scores: NumPy array with the score of every fish
+    :param n_rollouts: number of playouts
+    :param final: whether the observations end with the game
+    :param seed: seed of the random moves
+    :return: sum of the values of the playouts: the final score difference if the game ends, otherwise the score
+        difference counting the fish on the rods plus the estimation of evaluate_state
+    """
+    rng = np.random.default_rng(seed)
+    rows = np.arange(n_rollouts)
+    fish_cells = np.array([0 if position is None else position[0] * SPACE_SUBDIVISIONS + position[1]
+                           for position in fish], dtype=np.intp)
+    free = np.array([position is not None and fish_number not in caught for fish_number, position in enumerate(fish)])
+    free = np.repeat(free[None, :], n_rollouts, axis=0)
+    hook_cells = np.tile(np.array([hook[0] * SPACE_SUBDIVISIONS + hook[1] for hook in hooks], dtype=np.intp),
+                         (n_rollouts, 1))
+    rods = np.tile(np.array(caught, dtype=np.intp), (n_rollouts, 1))
+    values = np.full(n_rollouts, float(scores[0] - scores[1]))
+    signs = (1.0, -1.0)
+
+    for ply, observation in enumerate(observations):
+        mover = (player + ply) % 2
+        fish_cells = FISH_MOVE_CELLS[observation, fish_cells]
+        # Random moves, up for the players with a fish on the rod. A hook cannot move to the column of the other hook.
+        moves = rng.integers(0, 5, n_rollouts)
+        moves[rods[:, mover] != -1] = 1
+        hook = hook_cells[:, mover]
+        new_hook = HOOK_MOVE_CELLS[moves, hook]
+        blocked = new_hook // SPACE_SUBDIVISIONS == hook_cells[:, 1 - mover] // SPACE_SUBDIVISIONS
+        hook_cells[:, mover] = np.where(blocked, hook - hook % SPACE_SUBDIVISIONS + new_hook % SPACE_SUBDIVISIONS,
+                                        new_hook)
+
+        # Fish caught and pulled in, see compute_caught_fish
+        for i_player in range(2):
+            hook = hook_cells[:, i_player]
+            on_rod = rods[:, i_player] != -1
+            pulled_in = on_rod & (hook % SPACE_SUBDIVISIONS >= SURFACE)
+            if pulled_in.any():
+                values[pulled_in] += signs[i_player] * fish_scores[rods[pulled_in, i_player]]
+                rods[pulled_in, i_player] = -1
+            on_hook = free & (hook[:, None] == fish_cells[None, :]) & ~on_rod[:, None]
+            hit = on_hook.any(axis=1)
+            if hit.any():
+                playouts = rows[hit]
+                fish_numbers = on_hook[hit].argmax(axis=1)
+                free[playouts, fish_numbers] = False
+                at_surface = hook[hit] % SPACE_SUBDIVISIONS >= SURFACE
+                values[playouts[at_surface]] += signs[i_player] * fish_scores[fish_numbers[at_surface]]
+                rods[playouts[~at_surface], i_player] = fish_numbers[~at_surface]
+
+    if not final:
+        for i_player in range(2):
+            on_rod = rods[:, i_player] != -1
+            values[on_rod] += signs[i_player] * fish_scores[rods[on_rod, i_player]]
+        estimation = np.where(free, fish_scores * CLOSENESS[hook_cells[:, 0][:, None], fish_cells[None, :]], 0.0)
+        values += np.maximum(estimation.max(axis=1, initial=0.0), 0.0)
+    return float(values.sum())
+
+
+def init_worker(observation_rows=None):
+    """
+    Initialize a worker process of the pool
+    :param observation_rows: observations of the whole game, see game_tree.observation_rows, or None
+    :return:
+    """
+    global _observation_rows
+    _observation_rows = observation_rows
+
+
+def run_rollouts(arguments, observations):
+    """
+    Run the playouts of a leaf in a worker process
+    :param arguments: arguments of rollouts, except the observations
+    :param observations: observations of the next steps, or a 2-tuple (first row, end row) in the observations of
+        the whole game sent to the worker
+    :return: sum of the values of the playouts
+    """
+    if isinstance(observations, tuple):
+        observations = np.array(_observation_rows[observations[0]:observations[1]], dtype=np.intp)
+    hooks, caught, scores, player, fish, fish_scores, n_rollouts, final, seed = arguments
+    return rollouts(hooks, caught, scores, player, fish, observations, fish_scores, n_rollouts, final, seed)
+
+
+class TreeNode:
+    """
+    Node of the Monte Carlo tree, wrapping a node of the game tree. The values are sums of playout values for player 0.
+    """
+    __slots__ = ("node", "children", "untried", "visits", "total")
+
+    def __init__(self, node):
+        """
+        :param node: game tree node
+        """
+        self.node = node
+        # Expanded children, indexed by move
+        self.children = {}
+        # Legal moves without a child yet
+        self.untried = node.legal_moves()
+        self.visits = 0
+        self.total = 0.0
+
+
+class MonteCarloTreeSearch:
+    """
+    Monte Carlo tree search with UCT selection. Every new leaf is evaluated by ROLLOUTS random playouts run at once on
+    arrays. With workers, the leaves of several descents are collected with a virtual loss on their paths and their
+    playouts run in a pool of processes. The tree is kept between turns: the next search starts from the node reached
+    after the chosen move and the move of the opponent, when the tree has it.
+    """
+
+    def __init__(self, n_workers=0, observation_rows=None):
+        """
+        :param n_workers: number of worker processes running the playouts, 0 to run them in this process
+        :param observation_rows: observations of the whole game, sent once to every worker, or None
+        """
+        self.n_workers = n_workers
+        self.observation_rows = observation_rows
+        self.pool = None
+        if n_workers:
+            self.pool = mp.Pool(n_workers, initializer=init_worker, initargs=(observation_rows,))
+        # Root of the last search and the move played from it
+        self.root = None
+        self.move = None
+        # Length of the most visited line and number of playouts of the last search
+        self.depth = 0
+        self.playouts = 0
+        self.scale = 1.0
+        self.seed = 0
+
+    def search(self, node, initial_time, time_budget):
+        """
+        Grow the tree until the time is over and play the most visited move
+        :param node: root node, with player 0 to move
+        :param initial_time: the time at the beginning of the search
+        :param time_budget: seconds after initial_time the search may use, see TimeManager.budget
+        :return: the best move
+        """
+        moves = node.legal_moves()
+        self.depth = 0
+        self.playouts = 0
+        root = self.reuse_subtree(node)
+        if len(moves) <= 1:
+            # Forced move: keep the tree for the next turn
+            self.root, self.move = root, moves[0] if moves else 0
+            return self.move
+
+        fish_scores = node.state.fish_scores
+        # Values are compared in units of the total score of the fish left
+        self.scale = max(sum(abs(score) for score in fish_scores.values()), 1)
+        batch_size = LEAVES_PER_WORKER * self.n_workers if self.pool is not None else 1
+        # Leave time to receive the results of the workers
+        deadline = initial_time + time_budget - (RESULT_MARGIN if self.pool is not None else 0.0)
+        # At least one batch, so that the root has children even when the budget is already spent
+        while not root.children or time.time() < deadline:
+            paths = [self.select(root) for _ in range(batch_size)]
+            totals = self.evaluate([path[-1] for path in paths], deadline)
+            for path, total in zip(paths, totals):
+                self.backpropagate(path, total)
+
+        best_move = max(root.children, key=lambda move: root.children[move].visits)
+        self.root, self.move = root, best_move
+        line = root.children[best_move]
+        self.depth = 1
+        while line.children:
+            line = max(line.children.values(), key=lambda child: child.visits)
+            self.depth += 1
+        return best_move
+
+    def reuse_subtree(self, node):
+        """
+        Find the node of the new root in the tree of the last search
+        :param node: new root node
+        :return: TreeNode of the new root, with the statistics of the last search if it had the position
+        """
+        previous = self.root
+        if previous is not None and self.move in previous.children:
+            key = node.state.key
+            for child in previous.children[self.move].children.values():
+                if child.node.state.key == key:
+                    # Free the rest of the previous tree
+                    child.node.parent = None
+                    return child
+        return TreeNode(node)
+
+    def select(self, root):
+        """
+        Descend with UCT to a new leaf and add it to the tree. Every node of the path gets a virtual loss of ROLLOUTS
+        visits of the worst value for the player who chose it, taken back by backpropagate.
+        :param root: TreeNode of the root
+        :return: list of the TreeNodes from the root to the leaf
+        """
+        path = [root]
+        tree_node = root
+        while True:
+            if tree_node.untried:
+                move = tree_node.untried.pop()
+                child = TreeNode(tree_node.node.get_child(move))
+                tree_node.children[move] = child
+                path.append(child)
+                break
+            if not tree_node.children:
+                break
+            tree_node = self.best_child(tree_node)
+            path.append(tree_node)
+        for tree_node in path:
+            tree_node.visits += ROLLOUTS
+            tree_node.total += ROLLOUTS * self.loss(tree_node)
+        return path
+
+    def loss(self, tree_node):
+        """
+        Worst playout value for the player who moved to a node
+        :param tree_node: TreeNode
+        :return: value for player 0
+        """
+        return self.scale if tree_node.node.state.player == 0 else -self.scale
+
+    def best_child(self, tree_node):
+        """
+        Child with the highest upper confidence bound for the player to move
+        :param tree_node: TreeNode with every legal move expanded
+        :return: TreeNode
+        """
+        sign = 1.0 if tree_node.node.state.player == 0 else -1.0
+        log_visits = math.log(max(tree_node.visits, 1))
+        scale = self.scale
+        best, best_bound = None, float("-inf")
+        for child in tree_node.children.values():
+            if child.visits == 0:
+                # Its only playouts were not run in time
+                return child
+            bound = sign * child.total / (child.visits * scale) + UCT_EXPLORATION * math.sqrt(log_visits / child.visits)
+            if bound > best_bound:
+                best, best_bound = child, bound
+        return best
+
+    def backpropagate(self, path, total):
+        """
+        Replace the virtual loss of a path with the playout values of its leaf
+        :param path: list of TreeNodes returned by select
+        :param total: sum of the values of the playouts, or None if they were not run in time
+        :return:
+        """
+        for tree_node in path:
+            tree_node.total -= ROLLOUTS * self.loss(tree_node)
+            if total is None:
+                tree_node.visits -= ROLLOUTS
+            else:
+                tree_node.total += total
+        if total is not None:
+            self.playouts += ROLLOUTS
+
+    def evaluate(self, leaves, deadline):
+        """
+        Run the playouts of some leaves, in the pool when there is one
+        :param leaves: list of TreeNodes
+        :param deadline: time after which the results are not waited for
+        :return: list with the sum of the playout values of every leaf, None for the leaves not evaluated in time
+        """
+        tasks = [self.rollout_task(leaf.node) for leaf in leaves]
+        if self.pool is None:
+            return [run_rollouts(arguments, observations) for arguments, observations in tasks]
+        pending = [self.pool.apply_async(run_rollouts, task) for task in tasks]
+        totals = []
+        for result in pending:
+            try:
+                totals.append(result.get(timeout=max(deadline - time.time(), 0)))
+            except mp.TimeoutError:
+                totals.append(None)
+        return totals
+
+    def rollout_task(self, node):
+        """
+        Arguments of run_rollouts for the playouts of a node
+        :param node: game tree node
+        :return: 2-tuple (arguments, observations)
+        """
+        state = node.state
+        remaining_steps = len(node.observations) - node.depth
+        n_steps = min(ROLLOUT_PLIES, remaining_steps)
+        observations = node.observations
+        if self.pool is not None and isinstance(observations, ObservationSequence) and \
+                observations.rows is self.observation_rows:
+            # The workers already have the observations of the whole game
+            first_row = observations.offset + node.depth
+            observations = (first_row, first_row + n_steps)
+        else:
+            observations = np.array([observations[node.depth + ply] for ply in range(n_steps)],
+                                    dtype=np.intp).reshape(n_steps, len(state.fish))
+        fish_scores = np.array([state.fish_scores.get(fish_number, 0) for fish_number in range(len(state.fish))],
+                               dtype=float)
+        self.seed += 1
+        arguments = (state.hooks, state.caught, state.scores, state.player, state.fish, fish_scores, ROLLOUTS,
+                     n_steps == remaining_steps, self.seed)
+        return arguments, observations
+
+    def close(self):
+        """
+        Stop the worker processes
+        :return:
+        """
+        if self.pool is not None:
+            self.pool.terminate()
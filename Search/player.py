@@ -1,12 +1,21 @@
 #!/usr/bin/env python3
 
+import gc
 import time
 
 import numpy as np
 
-from fishing_game_core.game_tree import Node
+from fishing_game_core.game_tree import Node, FishTrajectories, SearchState, move_hook, observation_rows
 from fishing_game_core.player_utils import PlayerController
 from fishing_game_core.shared import ACTION_TO_STR
+from book import PositionBook, scenario_fingerprint
+from endgame import EndgameSolver, own_moves, SURFACE
+from expectimax import ExpectimaxSearch
+from mcts import MonteCarloTreeSearch
+from profiler import SearchProfiler
+from root_parallel import RootParallelSearch
+from time_manager import TimeManager, CLOCK_CHECK_MASK
+from transposition import TranspositionTable, EXACT, LOWER_BOUND, UPPER_BOUND
 
 
 class PlayerControllerHuman(PlayerController):
@@ -29,23 +38,11 @@ class PlayerControllerHuman(PlayerController):
 
 def compute_hash(node):
     """
-    Compute the hash of the node
+    Compute the hash of the node. The Zobrist key is kept up to date by the game tree, so this is O(1).
     :param node: the node to hash
     :return: the hash of the node
     """
-    position_fish = []
-    position_hook = []
-    player_scores = []
-    for element in node.state.hook_positions.items():
-        position_hook.append(element)
-
-    for element in node.state.get_fish_positions().items():
-        position_fish.append(element)
-
-    for element in node.state.player_scores.items():
-        player_scores.append(element)
-
-    return hash((tuple(position_hook), tuple(position_fish), tuple(player_scores)))
+    return node.state.key
 
 
 def distance_from_catch(fish_pos, hook_pos):
@@ -59,33 +56,167 @@ def distance_from_catch(fish_pos, hook_pos):
     return min(x, 20 - x) + abs(fish_pos[1] - hook_pos[1])
 
 
+# exp(-distance) for every distance a fish can be from a hook on the 20x20 grid, see distance_from_catch
+EXP_MINUS_DISTANCE = np.exp(-np.arange(30.0))
+
+
 def evaluation(node):
     """
     Compute the heuristic of the node
     :param node: the node to compute the heuristic
     :return: the heuristic of the node
     """
+    return evaluate_state(node.state)
+
 
-    score_diff = node.state.player_scores[0] - node.state.player_scores[1]
+def evaluate_state(state):
+    """
+    Compute the heuristic of a game state
+    :param state: State or SearchState instance
+    :return: the heuristic of the state
+    """
+    hook_max, hook_min = state.hooks
+    fish_scores = state.fish_scores
+    score_diff = state.scores[0] - state.scores[1]
 
     estimation = 0
-    for fish in node.state.fish_positions:
-        distance = distance_from_catch(
-            node.state.fish_positions[fish], node.state.hook_positions[0])
-        if distance == 0 and node.state.fish_scores[fish] > 0:
+    for fish, position in enumerate(state.fish):
+        if position is None:
+            continue
+        distance = distance_from_catch(position, hook_max)
+        if distance == 0 and fish_scores[fish] > 0:
             return float("inf")
-        elif distance_from_catch(node.state.fish_positions[fish], node.state.hook_positions[1]) == 0:
+        elif distance_from_catch(position, hook_min) == 0:
             return float("-inf")
         else:
             estimation = max(
-                estimation, node.state.fish_scores[fish] * np.exp(-distance))
+                estimation, fish_scores[fish] * EXP_MINUS_DISTANCE.item(distance))
     return score_diff + estimation
 
 
+def static_exchange(state):
+    """
+    Score difference once the fish on the rods are pulled in. Nothing can take a caught fish back, so a fish on a rod
+    is worth its score as soon as its player has enough moves left to bring it to the surface, and nothing otherwise.
+    :param state: SearchState instance
+    :return: the score difference
+    """
+    value = state.scores[0] - state.scores[1]
+    for player, fish_number in enumerate(state.caught):
+        if fish_number == -1:
+            continue
+        if own_moves(state.step, state.player, state.n_steps, player) >= SURFACE - state.caught_positions[player][1]:
+            score = state.fish_scores[fish_number]
+            value += score if player == 0 else -score
+    return value
+
+
+def quiet_evaluation(state):
+    """
+    Heuristic of a state with the fish on the rods valued by static_exchange instead of deciding the game, as
+    evaluate_state does, so that it can be compared with the heuristic of the positions around it
+    :param state: SearchState instance
+    :return: the heuristic of the state
+    """
+    hook_max = state.hooks[0]
+    fish_scores = state.fish_scores
+    caught = state.caught
+
+    estimation = 0
+    for fish, position in enumerate(state.fish):
+        if position is None or fish == caught[0] or fish == caught[1]:
+            continue
+        estimation = max(
+            estimation, fish_scores[fish] * EXP_MINUS_DISTANCE.item(distance_from_catch(position, hook_max)))
+    return static_exchange(state) + estimation
+
+
+def capture_moves(state):
+    """
+    Moves of the player to move that put its hook on a free fish worth catching
+    :param state: SearchState instance
+    :return: list of moves, the most valuable fish first, empty when the player has a fish on its rod
+    """
+    player = state.player
+    if state.caught[player] != -1 or state.step == state.n_steps:
+        return []
+    trajectories = state.trajectories
+    trajectories.extend(state.step + 1)
+    positions = trajectories.positions[state.step + 1 - trajectories.first_step]
+    targets = {}
+    for fish_number, position in enumerate(positions):
+        if (position is not None and fish_number not in state.removed and fish_number not in state.caught
+                and state.fish_scores[fish_number] > 0):
+            targets[position] = state.fish_scores[fish_number]
+    if not targets:
+        return []
+    hook, other_hook = state.hooks[player], state.hooks[1 - player]
+    # Moves blocked by the other hook end on the same cell, only the first of them is kept
+    captures = {}
+    for move in range(5):
+        new_hook = move_hook(hook, move, other_hook)
+        if new_hook in targets and new_hook not in captures:
+            captures[new_hook] = (move, targets[new_hook])
+    return [move for move, _ in sorted(captures.values(), key=lambda capture: capture[1], reverse=True)]
+
+
+# Number of plies from the root where children are ordered with the full evaluation function.
+# Deeper nodes are ordered with the cheap principal variation, killer and history heuristics.
+FULL_ORDERING_PLIES = 2
+# Number of plies from the root whose nodes keep their children for the whole turn. Deeper positions are searched in
+# place on a single SearchState, see alphabeta_state, so the memory of a search is bounded by its depth.
+KEPT_CHILDREN_PLIES = FULL_ORDERING_PLIES
+# Half width of the aspiration window around the value of the previous iteration
+ASPIRATION_WINDOW = 1.0
+# Width of the windows used to prove that a move is not better than the principal variation
+NULL_WINDOW = 1e-6
+# Largest number of plies the quiescence search adds below the horizon
+QUIESCENCE_PLIES = 4
+
+
 class PlayerControllerMinimax(PlayerController):
 
     def __init__(self):
         super(PlayerControllerMinimax, self).__init__()
+        # Kept for the whole game so that every turn can reuse the previous searches
+        self.transposition_table = TranspositionTable()
+        # Moves of the principal variation of the last completed iteration, indexed by ply
+        self.principal_variation = []
+        # Two moves that caused a cutoff at each ply, most recent first
+        self.killer_moves = {}
+        # Cutoff counts keyed by (player, move), kept across iterations and decayed between turns
+        self.history = {}
+        # Pool searching the root moves in parallel, see settings.search_workers
+        self.root_parallel = None
+        # Moves searched in previous games, see settings.position_book
+        self.book = None
+        # Solver proving the best move when few fish are left
+        self.endgame = EndgameSolver()
+        # Expectimax search used instead of the minimax search, see settings.search_mode
+        self.expectimax = None
+        # Monte Carlo tree search used instead of the minimax search, see settings.search_mode
+        self.mcts = None
+        # Positions of the free fish below the root of the current search, shared by the SearchState instances
+        self.trajectories = None
+        # Observations of the whole game, one row per step, when the first message carries them
+        self.observation_rows = None
+        # Budget of the searches, from the time threshold and the measured latency of the messages
+        self.time_manager = TimeManager()
+        # Seconds the current search may use, see TimeManager.budget
+        self.time_budget = self.time_manager.budget(time.time())
+        # Best root move of the interrupted depth, proven better than the best move of the depth before
+        self.partial_best_move = None
+        # Root of the last iterative deepening search, with the children of its first plies, and the move played
+        self.previous_root = None
+        self.previous_move = None
+        # Deepest depth completed by the last search
+        self.search_depth = 0
+        # Counters of the last search: searched nodes, nodes whose children were searched and cutoffs among them
+        self.statistics = {"nodes": 0, "interior_nodes": 0, "cutoffs": 0}
+        # Profiling of the hot functions of the search, see settings.profile_log
+        self.profiler = None
+        # Seconds spent in the last search when profiling, sent to the game as search_time
+        self.search_time = None
 
     def player_loop(self):
         """
@@ -95,18 +226,64 @@ class PlayerControllerMinimax(PlayerController):
 
         # Generate first message (Do not remove this line!)
         first_msg = self.receiver()
-
-        while True:
-            msg = self.receiver()
-
-            # Create the root node of the game tree
-            node = Node(message=msg, player=0)
-
-            # Possible next moves: "stay", "left", "right", "up", "down"
-            best_move = self.search_best_next_move(initial_tree_node=node)
-
-            # Execute next action
-            self.sender({"action": best_move, "search_time": None})
+        self.initialize_search(first_msg)
+
+        try:
+            while True:
+                msg = self.receiver()
+                self.time_manager.start_turn(msg)
+
+                # Create the root node of the game tree
+                node = Node(message=msg, player=0, observations=self.observation_rows)
+
+                # Possible next moves: "stay", "left", "right", "up", "down"
+                best_move = self.search_best_next_move(initial_tree_node=node)
+
+                # Execute next action
+                self.sender({"action": best_move, "search_time": self.search_time})
+
+                # Collect the garbage of the search while the game runs, see search_best_next_move
+                gc.collect()
+        finally:
+            # The loop ends when the game is over
+            if self.book is not None:
+                self.book.save()
+            if self.profiler is not None:
+                self.profiler.close()
+            if self.root_parallel is not None:
+                self.root_parallel.close()
+            if self.mcts is not None:
+                self.mcts.close()
+
+    def initialize_search(self, first_msg):
+        """
+        Prepare the search for a new game
+        :param first_msg: first message sent by the game, with the type and score of every fish and optionally the
+            observation sequences of the whole game
+        :return:
+        """
+        self.time_manager = TimeManager(getattr(self.settings, "time_threshold", self.time_manager.time_threshold))
+        # Preload the observations once, the next messages then only carry the current step
+        if "observations" in first_msg:
+            self.observation_rows = observation_rows(first_msg["observations"])
+        # The book needs the observations of the whole game to tell the scenarios apart
+        book_file = getattr(self.settings, "position_book", None)
+        if book_file and self.observation_rows is not None:
+            self.book = PositionBook(book_file, scenario_fingerprint(self.observation_rows))
+        profile_log = getattr(self.settings, "profile_log", None)
+        if profile_log:
+            self.profiler = SearchProfiler(profile_log)
+            self.profiler.install()
+        search_mode = getattr(self.settings, "search_mode", "minimax")
+        n_workers = getattr(self.settings, "search_workers", 0)
+        if search_mode == "expectimax":
+            self.expectimax = ExpectimaxSearch(self.settings.observation_horizon)
+        elif search_mode == "mcts":
+            # The workers run the playouts
+            self.mcts = MonteCarloTreeSearch(n_workers, self.observation_rows)
+        elif n_workers:
+            # Split the root moves across a pool of worker processes
+            self.root_parallel = RootParallelSearch(n_workers, self.observation_rows)
 
     def search_best_next_move(self, initial_tree_node):
         """
@@ -133,10 +310,104 @@ class PlayerControllerMinimax(PlayerController):
         best_move = children[scores.index(max(scores))].move
         """
         initial_time = time.time()
+        self.time_budget = self.time_manager.budget(initial_time)
+        if self.profiler is not None:
+            self.profiler.start_turn()
+
+        key = compute_hash(initial_tree_node)
+        entry = self.book.probe(key) if self.book is not None else None
+        if entry is not None:
+            # Position searched in a previous game
+            self.search_depth = entry[1]
+            best_move = entry[0]
+        else:
+            # A collection of the whole heap takes longer than the safety margin, it waits for the end of the search
+            gc.disable()
+            try:
+                best_move = self.search_move(initial_tree_node, initial_time)
+            finally:
+                gc.enable()
+            if self.book is not None and self.search_depth > 0:
+                self.book.store(key, best_move, self.search_depth)
+
+        if self.profiler is not None:
+            self.search_time = self.profiler.end_turn(self.search_depth, self.statistics)
+        return ACTION_TO_STR[best_move]
+
+    def search_move(self, node, initial_time):
+        """
+        Search the best move of the root with the expectimax search, the Monte Carlo tree search, the endgame solver,
+        the root-parallel search or iterative deepening
+        :param node: the root node
+        :param initial_time: the time at the beginning of the search
+        :return: the best move, as an integer
+        """
+        resumed = self.resume_search(node)
+        if self.expectimax is not None:
+            # The other searches trust every observation
+            best_move = self.expectimax.search(node, initial_time, self.time_budget)
+            self.search_depth = self.expectimax.depth
+            return best_move
+
+        if self.mcts is not None:
+            best_move = self.mcts.search(node, initial_time, self.time_budget)
+            self.search_depth = self.mcts.depth
+            return best_move
+
+        if self.endgame.applies(node):
+            # Play the proven best move if the solver finds one quickly, otherwise search as usual
+            best_move = self.endgame.solve(node, initial_time)
+            if best_move is not None:
+                self.search_depth = self.endgame.depth
+                return best_move
+
+        if self.root_parallel is not None:
+            best_move = self.root_parallel.search(node, initial_time, self.time_budget)
+            self.search_depth = self.root_parallel.last_depth
+            if best_move is None:
+                # Not even the first depth was completed for every move: fall back to the heuristic, or stay as the
+                # sequential search does when there is no move
+                children = node.compute_and_get_children()
+                best_move = max(children, key=evaluation).move if children else 0
+            return best_move
 
-        return ACTION_TO_STR[self.iterative_deepening_search(initial_tree_node, initial_time)]
+        best_move = self.iterative_deepening_search(node, initial_time, resumed=resumed)
+        self.previous_root, self.previous_move = node, best_move
+        return best_move
 
-    def alphabeta(self, node, depth, alpha, beta, player, initial_time, visited):
+    def resume_search(self, node):
+        """
+        Find the new root in the tree of the previous search: the child of the move played, then its child with the
+        position the opponent left. The previous search already searched below it, so iterative deepening resumes at
+        the depth the transposition table has for it, and the principal variation and the killer moves are shifted
+        by the two plies played.
+        :param node: the new root node
+        :return: 3-tuple (first depth, best move, value) to start iterative deepening with, or None if the position was
+            not in the previous tree
+        """
+        previous_root, self.previous_root = self.previous_root, None
+        if previous_root is None:
+            return None
+        key = compute_hash(node)
+        grandchild = None
+        for child in previous_root.children:
+            if child.move == self.previous_move:
+                grandchild = next((grandchild for grandchild in child.children if compute_hash(grandchild) == key), None)
+        if grandchild is None:
+            return None
+
+        principal_variation = self.principal_variation
+        self.principal_variation = principal_variation[2:] if principal_variation[:2] == [self.previous_move,
+                                                                                        grandchild.move] else []
+        self.killer_moves = {ply - 2: killers for ply, killers in self.killer_moves.items() if ply >= 2}
+        entry = self.transposition_table.probe(key)
+        if entry is None or entry[4] is None:
+            return 1, 0, None
+        # The children of the root are searched to the depth of the iteration, so the entry of the root covers the
+        # iteration before its depth
+        return max(entry[1] - 1, 1), entry[4], entry[2] if entry[3] == EXACT else None
+
+    def alphabeta(self, node, depth, alpha, beta, player, initial_time):
         """
         Alpha beta pruning algorithm for the game
         :param node: the current node
@@ -145,65 +416,407 @@ class PlayerControllerMinimax(PlayerController):
         :param beta: the current best value achievable by 1
         :param player: current player
         :param initial_time: the time at the beginning of the search
-        :param visited: the visited nodes
         :return: the minimax value of the state
         """
 
+        if node.depth >= KEPT_CHILDREN_PLIES and self.trajectories is not None:
+            # Below the kept plies the moves are played in place on a single mutable state
+            return self.alphabeta_state(SearchState(node, self.trajectories), depth, alpha, beta, initial_time)
+
+        statistics = self.statistics
+        statistics["nodes"] += 1
+        # The clock is only read every few nodes, before the table can return
+        if statistics["nodes"] & CLOCK_CHECK_MASK == 0 and time.time() - initial_time >= self.time_budget:
+            raise TimeoutError
         k = compute_hash(node)
-        if k in visited and visited[k][0] >= depth:
-            return visited[k][1]
+        alpha_orig, beta_orig = alpha, beta
+        entry = self.transposition_table.probe(k)
+        tt_move = None
+        if entry is not None:
+            tt_move = entry[4]
+            if entry[1] >= depth:
+                if entry[3] == EXACT:
+                    return entry[2]
+                elif entry[3] == LOWER_BOUND:
+                    alpha = max(alpha, entry[2])
+                else:
+                    beta = min(beta, entry[2])
+                if alpha >= beta:
+                    return entry[2]
+
+        best_move = None
+        moves = node.legal_moves() if depth > 0 else []
+        if len(moves) == 0 and self.trajectories is not None:
+            state = SearchState(node, self.trajectories)
+            value = self.quiescence(state, alpha, beta, QUIESCENCE_PLIES if depth == 0 else 0, initial_time)
+        elif len(moves) == 0:
+            value = evaluation(node)
 
-        children = node.compute_and_get_children()
-        children.sort(key=evaluation, reverse=True)
+        elif player == 0:
+            statistics["interior_nodes"] += 1
+            children = self.ordered_children(node, player, tt_move)
+            value = float("-inf")
+            for i, child in enumerate(children):
+                if i == 0 or alpha == float("-inf"):
+                    child_value = self.alphabeta(child, depth-1, alpha, beta, 1 - player, initial_time)
+                else:
+                    # Principal variation search: prove the child is not better with a null window
+                    child_value = self.alphabeta(child, depth-1, alpha, alpha + NULL_WINDOW, 1 - player, initial_time)
+                    if alpha < child_value < beta:
+                        child_value = self.alphabeta(child, depth-1, alpha, beta, 1 - player, initial_time)
+                if child_value > value or best_move is None:
+                    value, best_move = child_value, child.move
+                alpha = max(alpha, value)
+                if alpha >= beta:
+                    self.record_cutoff(child.move, node.depth, player, depth)
+                    break
+        else:
+            statistics["interior_nodes"] += 1
+            children = self.ordered_children(node, player, tt_move)
+            value = float("inf")
+            for i, child in enumerate(children):
+                if i == 0 or beta == float("inf"):
+                    child_value = self.alphabeta(child, depth-1, alpha, beta, 1 - player, initial_time)
+                else:
+                    # Principal variation search: prove the child is not better with a null window
+                    child_value = self.alphabeta(child, depth-1, beta - NULL_WINDOW, beta, 1 - player, initial_time)
+                    if alpha < child_value < beta:
+                        child_value = self.alphabeta(child, depth-1, alpha, beta, 1 - player, initial_time)
+                if child_value < value or best_move is None:
+                    value, best_move = child_value, child.move
+                beta = min(beta, value)
+                if alpha >= beta:
+                    self.record_cutoff(child.move, node.depth, player, depth)
+                    break
+
+        if value <= alpha_orig:
+            flag = UPPER_BOUND
+        elif value >= beta_orig:
+            flag = LOWER_BOUND
+        else:
+            flag = EXACT
+        self.transposition_table.store(k, depth, value, flag, best_move)
+        return value
+
+    def alphabeta_state(self, state, depth, alpha, beta, initial_time):
+        """
+        Alpha beta pruning on a mutable search state, with the same pruning and move ordering as alphabeta
+        :param state: SearchState instance, left unchanged unless the search times out
+        :param depth: depth maximum to go down the tree
+        :param alpha: the current best value achievable by 0
+        :param beta: the current best value achievable by 1
+        :param initial_time: the time at the beginning of the search
+        :return: the minimax value of the state
+        """
 
-        if time.time() - initial_time >= 0.055:
+        statistics = self.statistics
+        statistics["nodes"] += 1
+        # The clock is only read every few nodes, before the table can return
+        if statistics["nodes"] & CLOCK_CHECK_MASK == 0 and time.time() - initial_time >= self.time_budget:
             raise TimeoutError
+        k = state.key
+        alpha_orig, beta_orig = alpha, beta
+        entry = self.transposition_table.probe(k)
+        tt_move = None
+        if entry is not None:
+            tt_move = entry[4]
+            if entry[1] >= depth:
+                if entry[3] == EXACT:
+                    return entry[2]
+                elif entry[3] == LOWER_BOUND:
+                    alpha = max(alpha, entry[2])
+                else:
+                    beta = min(beta, entry[2])
+                if alpha >= beta:
+                    return entry[2]
 
-        if depth == 0 or len(children) == 0:
-            value = evaluation(node)
+        best_move = None
+        player = state.player
+        moves = state.legal_moves() if depth > 0 else []
+        if len(moves) == 0:
+            # The horizon is extended along the capture lines only
+            value = self.quiescence(state, alpha, beta, QUIESCENCE_PLIES if depth == 0 else 0, initial_time)
 
         elif player == 0:
+            statistics["interior_nodes"] += 1
+            self.order_moves(moves, state.step, player, tt_move)
             value = float("-inf")
-            for child in children:
-                value = max(value, self.alphabeta(
-                    child, depth-1, alpha, beta, 1 - player, initial_time, visited))
+            for i, move in enumerate(moves):
+                state.apply(move)
+                if i == 0 or alpha == float("-inf"):
+                    child_value = self.alphabeta_state(state, depth-1, alpha, beta, initial_time)
+                else:
+                    # Principal variation search: prove the move is not better with a null window
+                    child_value = self.alphabeta_state(state, depth-1, alpha, alpha + NULL_WINDOW, initial_time)
+                    if alpha < child_value < beta:
+                        child_value = self.alphabeta_state(state, depth-1, alpha, beta, initial_time)
+                state.undo()
+                if child_value > value or best_move is None:
+                    value, best_move = child_value, move
                 alpha = max(alpha, value)
                 if alpha >= beta:
+                    self.record_cutoff(move, state.step, player, depth)
                     break
         else:
+            statistics["interior_nodes"] += 1
+            self.order_moves(moves, state.step, player, tt_move)
             value = float("inf")
-            for child in children:
-                value = min(value, self.alphabeta(
-                    child, depth-1, alpha, beta, 1 - player, initial_time, visited))
+            for i, move in enumerate(moves):
+                state.apply(move)
+                if i == 0 or beta == float("inf"):
+                    child_value = self.alphabeta_state(state, depth-1, alpha, beta, initial_time)
+                else:
+                    # Principal variation search: prove the move is not better with a null window
+                    child_value = self.alphabeta_state(state, depth-1, beta - NULL_WINDOW, beta, initial_time)
+                    if alpha < child_value < beta:
+                        child_value = self.alphabeta_state(state, depth-1, alpha, beta, initial_time)
+                state.undo()
+                if child_value < value or best_move is None:
+                    value, best_move = child_value, move
                 beta = min(beta, value)
                 if alpha >= beta:
+                    self.record_cutoff(move, state.step, player, depth)
                     break
 
-        key = compute_hash(node)
-        visited.update({key: (depth, value)})
+        if value <= alpha_orig:
+            flag = UPPER_BOUND
+        elif value >= beta_orig:
+            flag = LOWER_BOUND
+        else:
+            flag = EXACT
+        self.transposition_table.store(k, depth, value, flag, best_move)
         return value
 
-    def iterative_deepening_search(self, node, initial_time):
+    def quiescence(self, state, alpha, beta, plies, initial_time):
+        """
+        Search of the capture lines below the horizon. The player to move either keeps the quiet evaluation of the
+        state or catches a fish, and the fish on the rods are valued by static_exchange, so that the pull-in lines need
+        no search. The captures of the most valuable fish are searched first. No capture is skipped before it is searched:
+        the estimation of the free fish changes with the hook and the caught fish, so the score of the fish does not
+        bound what a capture gains, and QUIESCENCE_PLIES alone limits the search.
+        :param state: SearchState instance, left unchanged unless the search times out
+        :param alpha: the current best value achievable by 0
+        :param beta: the current best value achievable by 1
+        :param plies: number of plies the search may still add
+        :param initial_time: the time at the beginning of the search
+        :return: the value of the state
+        """
+
+        value = quiet_evaluation(state)
+        captures = capture_moves(state) if plies > 0 else []
+        if len(captures) == 0:
+            return value
+
+        statistics = self.statistics
+        statistics["interior_nodes"] += 1
+        if state.player == 0:
+            if value >= beta:
+                return value
+            alpha = max(alpha, value)
+            for move in captures:
+                # The state itself was counted by the caller, the positions after the captures are counted here
+                statistics["nodes"] += 1
+                if statistics["nodes"] & CLOCK_CHECK_MASK == 0 and time.time() - initial_time >= self.time_budget:
+                    raise TimeoutError
+                state.apply(move)
+                child_value = self.quiescence(state, alpha, beta, plies - 1, initial_time)
+                state.undo()
+                value = max(value, child_value)
+                alpha = max(alpha, value)
+                if alpha >= beta:
+                    statistics["cutoffs"] += 1
+                    break
+        else:
+            if value <= alpha:
+                return value
+            beta = min(beta, value)
+            for move in captures:
+                statistics["nodes"] += 1
+                if statistics["nodes"] & CLOCK_CHECK_MASK == 0 and time.time() - initial_time >= self.time_budget:
+                    raise TimeoutError
+                state.apply(move)
+                child_value = self.quiescence(state, alpha, beta, plies - 1, initial_time)
+                state.undo()
+                value = min(value, child_value)
+                beta = min(beta, value)
+                if alpha >= beta:
+                    statistics["cutoffs"] += 1
+                    break
+        return value
+
+    def ordered_children(self, node, player, tt_move):
+        """
+        Children of a node in the order they should be searched
+        :param node: the current node
+        :param player: current player
+        :param tt_move: best move stored in the transposition table, or None
+        :return: list of children nodes. Only the nodes above KEPT_CHILDREN_PLIES are searched as nodes, deeper ones
+            are searched on a SearchState by alphabeta_state.
+        """
+        children = node.compute_and_get_children()
+        self.order_children(children, node.depth, player, tt_move)
+        return children
+
+    def order_moves(self, moves, ply, player, tt_move):
+        """
+        Sort moves in place with the principal variation, killer and history heuristics
+        :param moves: list of legal moves
+        :param ply: distance from the root of the search
+        :param player: current player
+        :param tt_move: best move stored in the transposition table, or None
+        :return:
+        """
+        pv_move = self.principal_variation[ply] if ply < len(self.principal_variation) else None
+        killers = self.killer_moves.get(ply, ())
+        history = self.history
+        moves.sort(key=lambda move: (move == tt_move, move == pv_move, move in killers, history.get((player, move), 0)),
+                   reverse=True)
+
+    def order_children(self, children, ply, player, tt_move):
+        """
+        Sort the children in place so that the most promising moves are searched first
+        :param children: list of children nodes
+        :param ply: distance from the root of the search
+        :param player: current player
+        :param tt_move: best move stored in the transposition table, or None
+        :return:
+        """
+        if ply < FULL_ORDERING_PLIES:
+            children.sort(key=evaluation, reverse=player == 0)
+            if tt_move is not None:
+                # Search the best move of the previous search first
+                children.sort(key=lambda child: child.move != tt_move)
+        else:
+            moves = [child.move for child in children]
+            self.order_moves(moves, ply, player, tt_move)
+            children.sort(key=lambda child: moves.index(child.move))
+
+    def record_cutoff(self, move, ply, player, depth):
+        """
+        Update the killer moves and the history heuristic after a cutoff
+        :param move: move that caused the cutoff
+        :param ply: distance from the root of the search
+        :param player: current player
+        :param depth: remaining depth of the node where the cutoff happened
+        :return:
+        """
+        self.statistics["cutoffs"] += 1
+        killers = self.killer_moves.setdefault(ply, [])
+        if move not in killers:
+            killers.insert(0, move)
+            del killers[2:]
+        key = (player, move)
+        self.history[key] = self.history.get(key, 0) + depth * depth
+
+    def extract_principal_variation(self, node, best_move):
+        """
+        Follow the best moves stored in the transposition table from the root
+        :param node: the root node
+        :param best_move: best move found at the root
+        :return: list of moves, indexed by ply
+        """
+        moves = []
+        move = best_move
+        while move is not None:
+            if move not in node.legal_moves():
+                break
+            moves.append(move)
+            node = node.get_child(move)
+            entry = self.transposition_table.probe(compute_hash(node))
+            move = entry[4] if entry is not None else None
+        return moves
+
+    def iterative_deepening_search(self, node, initial_time, max_depth=None, resumed=None):
         """
         Iterative deepening search algorithm
         :param node: the current node
         :param initial_time: the time at the beginning of the search
+        :param max_depth: optional deepest depth to search
+        :param resumed: result of resume_search, to continue the search of the previous turn
         :return: the best move
         """
 
-        depth = 1
-        best_move = 0
-        visited = {}
-        while True:
+        if resumed is None:
+            depth, best_move, value = 1, 0, None
+            self.principal_variation = []
+            self.killer_moves = {}
+        else:
+            depth, best_move, value = resumed
+        self.statistics = {"nodes": 0, "interior_nodes": 0, "cutoffs": 0}
+        self.transposition_table.new_search()
+        self.history = {key: value // 2 for key, value in self.history.items()}
+        self.search_depth = 0
+        self.trajectories = FishTrajectories([node])
+        first_depth = depth
+        previous_nodes = 0
+        while max_depth is None or depth <= max_depth:
+            iteration_start, iteration_start_nodes = time.time(), self.statistics["nodes"]
+            self.partial_best_move = None
             try:
-                children = node.compute_and_get_children()
-                scores = []
-                for child in children:
-                    scores.append(self.alphabeta(
-                        child, depth, float("-inf"), float("inf"), 1, initial_time, visited))
-                best_move = children[scores.index(max(scores))].move
+                # Aspiration window around the value of the previous depth, widened on the failing side
+                if value is None or abs(value) == float("inf"):
+                    alpha, beta = float("-inf"), float("inf")
+                else:
+                    alpha, beta = value - ASPIRATION_WINDOW, value + ASPIRATION_WINDOW
+                while True:
+                    value, move = self.search_root(node, depth, alpha, beta, best_move, initial_time)
+                    if value <= alpha and alpha != float("-inf"):
+                        alpha = float("-inf")
+                    elif value >= beta and beta != float("inf"):
+                        beta = float("inf")
+                    else:
+                        break
+                best_move = move
+                self.principal_variation = self.extract_principal_variation(node, best_move)
+                self.search_depth = depth
                 depth += 1
             except TimeoutError:
+                # A move proven better than the previous best move before the timeout is kept
+                if self.partial_best_move is not None:
+                    best_move = self.partial_best_move
                 break
 
+            # Do not start a depth that is not expected to finish
+            now = time.time()
+            iteration_nodes = self.statistics["nodes"] - iteration_start_nodes
+            if not self.time_manager.should_deepen(now - initial_time, self.time_budget, now - iteration_start,
+                                                   iteration_nodes, previous_nodes):
+                break
+            if resumed is None or depth - first_depth > 1:
+                # The first resumed depth mostly hits the transposition table, it tells nothing of the next ones
+                previous_nodes = iteration_nodes
+
         return best_move
+
+    def search_root(self, node, depth, alpha, beta, previous_best_move, initial_time):
+        """
+        Search the children of the root (a MAX node) with principal variation search
+        :param node: the root node
+        :param depth: depth of the search below the children of the root
+        :param alpha: lower bound of the aspiration window
+        :param beta: upper bound of the aspiration window
+        :param previous_best_move: best move of the previous iteration, searched first
+        :param initial_time: the time at the beginning of the search
+        :return: 2-tuple with the value of the root and the best move
+        """
+        children = node.compute_and_get_children()
+        children.sort(key=lambda child: child.move != previous_best_move)
+        value = float("-inf")
+        best_move = children[0].move
+        alpha_orig = alpha
+        for i, child in enumerate(children):
+            if i == 0 or alpha == float("-inf"):
+                child_value = self.alphabeta(child, depth, alpha, beta, 1, initial_time)
+            else:
+                child_value = self.alphabeta(child, depth, alpha, alpha + NULL_WINDOW, 1, initial_time)
+                if alpha < child_value < beta:
+                    child_value = self.alphabeta(child, depth, alpha, beta, 1, initial_time)
+            if child_value > value:
+                value, best_move = child_value, child.move
+                if i > 0 and value > alpha_orig:
+                    # Exact value or lower bound above the first move, still valid if the depth times out
+                    self.partial_best_move = best_move
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                break
+        return value, best_move
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+# Entry point of the player process. It must not import Kivy or the game app, even indirectly, so that the process
+# starts small with any start method: only the player module and the game tree it imports are loaded.
+
+
+def get_player_controller(player_type):
+    """
+    Create the controller of the player
+    :param player_type: either 'ai_minimax' or 'human', see settings.player_type
+    :return: PlayerController instance
+    """
+    if player_type == "ai_minimax":
+        from player import PlayerControllerMinimax
+        return PlayerControllerMinimax()
+    elif player_type == "human":
+        from player import PlayerControllerHuman
+        return PlayerControllerHuman()
+    raise AttributeError("Parameter " + player_type + " not understood")
+
+
+def run_player(settings, pipes, channels=None):
+    """
+    Play a game in the player process
+    :param settings: Settings instance
+    :param pipes: 2-tuple (receiver pipe, sender pipe)
+    :param channels: optional 2-tuple (receiver channel, sender channel), see SharedMemoryChannel
+    :return:
+    """
+    player_controller = get_player_controller(settings.player_type)
+    player_controller.load_settings(settings)
+    player_controller.set_receive_send_pipes(*pipes)
+    if channels is not None:
+        player_controller.set_receive_send_channels(*channels)
+    player_controller.player_loop()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+import json
+from time import perf_counter
+
+
+def profiled_functions():
+    """
+    Hot functions of the minimax search, timed by SearchProfiler. Below the kept plies the search goes through
+    alphabeta_state, quiescence, quiet_evaluation and SearchState.apply rather than alphabeta, evaluation and
+    Node.compute_next_state, so both are listed.
+    :return: list of 3-tuples (module or class, attribute name, label)
+    """
+    # Imported here because player.py imports this module
+    import player
+    from fishing_game_core.game_tree import Node, SearchState
+    return [
+        (player.PlayerControllerMinimax, "alphabeta", "alphabeta"),
+        (player.PlayerControllerMinimax, "alphabeta_state", "alphabeta_state"),
+        (player.PlayerControllerMinimax, "quiescence", "quiescence"),
+        (player, "evaluation", "evaluation"),
+        (player, "quiet_evaluation", "quiet_evaluation"),
+        (player, "compute_hash", "compute_hash"),
+        (Node, "compute_and_get_children", "Node.compute_and_get_children"),
+        (Node, "compute_next_state", "Node.compute_next_state"),
+        (SearchState, "apply", "SearchState.apply"),
+    ]
+
+
+class SearchProfiler:
+    """
+    Opt-in profiling of the minimax player. install() replaces the functions of profiled_functions with wrappers
+    counting their calls and timing them, close() puts the original functions back, so that the search pays nothing
+    when profiling is off. The time of a function is cumulative: a recursive call is counted but not timed again.
+    Every turn gives a record with the call counts, the times, the depth reached and the statistics of the search, and
+    the records of a game are appended to the log file as one JSON line.
+    """
+
+    def __init__(self, filename):
+        """
+        :param filename: path of the log file, one line per game
+        """
+        self.filename = filename
+        # Counters of the current turn, by label. The wrappers update these dictionaries in place.
+        self.calls = {}
+        self.times = {}
+        # Records of the turns of the game
+        self.turns = []
+        self.turn_start = None
+        # (owner, name, original attribute) of every wrapped function
+        self.originals = []
+
+    def install(self):
+        """
+        Wrap the profiled functions
+        :return:
+        """
+        if self.originals:
+            return
+        for owner, name, label in profiled_functions():
+            # The attribute of a class is read from its dictionary, so that putting it back restores it exactly
+            function = owner.__dict__[name] if isinstance(owner, type) else getattr(owner, name)
+            self.originals.append((owner, name, function))
+            setattr(owner, name, self.wrap(function, label))
+
+    def wrap(self, function, label):
+        """
+        Wrapper of a function counting its calls and adding the time of the outermost ones
+        :param function: function or method to wrap
+        :param label: name of the function in the records
+        :return: the wrapper
+        """
+        calls, times = self.calls, self.times
+        calls[label], times[label] = 0, 0.0
+        # Whether a call of the function is running, recursive calls are not timed twice
+        running = [False]
+
+        def wrapper(*args, **kwargs):
+            calls[label] += 1
+            if running[0]:
+                return function(*args, **kwargs)
+            running[0] = True
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                times[label] += perf_counter() - start
+                running[0] = False
+
+        wrapper.__name__ = function.__name__
+        wrapper.__doc__ = function.__doc__
+        return wrapper
+
+    def start_turn(self):
+        """
+        Reset the counters before the search of a turn
+        :return:
+        """
+        for label in self.calls:
+            self.calls[label] = 0
+            self.times[label] = 0.0
+        self.turn_start = perf_counter()
+
+    def end_turn(self, depth, statistics):
+        """
+        Record the turn that just ended
+        :param depth: deepest depth completed by the search
+        :param statistics: counters of the search, see PlayerControllerMinimax.statistics
+        :return: seconds spent in the search of the turn
+        """
+        search_time = perf_counter() - self.turn_start
+        self.turns.append({"turn": len(self.turns), "search_time": search_time, "depth": depth,
+                           "nodes": statistics["nodes"], "cutoffs": statistics["cutoffs"],
+                           "calls": dict(self.calls), "times": dict(self.times)})
+        return search_time
+
+    def close(self):
+        """
+        Put the original functions back and append the records of the game to the log file
+        :return:
+        """
+        for owner, name, function in reversed(self.originals):
+            setattr(owner, name, function)
+        self.originals = []
+        if not self.turns:
+            return
+        calls = {label: sum(turn["calls"][label] for turn in self.turns) for label in self.calls}
+        times = {label: sum(turn["times"][label] for turn in self.turns) for label in self.times}
+        record = {"turns": self.turns, "calls": calls, "times": times,
+                  "search_time": sum(turn["search_time"] for turn in self.turns),
+                  "mean_depth": sum(turn["depth"] for turn in self.turns) / len(self.turns)}
+        with open(self.filename, "a") as f:
+            f.write(json.dumps(record) + "\n")
+        self.turns = []
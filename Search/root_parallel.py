@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+import multiprocessing as mp
+import time
+
+from fishing_game_core.game_tree import Node, FishTrajectories, ObservationSequence
+
+# Deepest iteration the workers can share an alpha bound for
+MAX_PARALLEL_DEPTH = 128
+# Seconds the workers stop before the deadline of the main search, to leave time to send the results back
+RESULT_MARGIN = 5e-3
+
+# Per-process state of the workers, set by init_worker
+_worker_player = None
+_shared_alpha = None
+_observation_rows = None
+
+
+def init_worker(shared_alpha, observation_rows=None):
+    """
+    Initialize a worker process of the pool
+    :param shared_alpha: shared array with the best value found so far at the root for every depth
+    :param observation_rows: observations of the whole game, see game_tree.observation_rows, or None
+    :return:
+    """
+    global _worker_player, _shared_alpha, _observation_rows
+    # Imported here because player.py imports this module
+    from player import PlayerControllerMinimax
+    _worker_player = PlayerControllerMinimax()
+    _shared_alpha = shared_alpha
+    _observation_rows = observation_rows
+
+
+def search_root_moves(moves, states, observations, initial_time, time_limit):
+    """
+    Iterative deepening search below some of the root moves, run in a worker process
+    :param moves: the root moves assigned to this worker
+    :param states: states reached after each of the root moves
+    :param observations: observations of the root node, or the step of the root when the worker has the observations
+        of the whole game
+    :param initial_time: the time at the beginning of the search in the main process
+    :param time_limit: seconds after initial_time at which the main process needs the results
+    :return: dict mapping each move to 2-tuple with the dict depth -> (value, exact) of every completed depth and
+        whether the last value is final. A value that is not exact failed low, it is only an upper bound.
+    """
+    if isinstance(observations, int):
+        observations = ObservationSequence(_observation_rows, observations)
+    children = []
+    for move, state in zip(moves, states):
+        child = Node(root=False)
+        child.state = state
+        child.move = move
+        child.depth = 1
+        child.observations = observations
+        children.append(child)
+
+    player = _worker_player
+    player.transposition_table.new_search()
+    player.killer_moves = {}
+    player.trajectories = FishTrajectories(children)
+    player.time_budget = time_limit - RESULT_MARGIN
+    results = {move: ({}, False) for move in moves}
+    depth = 1
+    try:
+        while depth < MAX_PARALLEL_DEPTH:
+            for child in children:
+                values, final = results[child.move]
+                if final:
+                    continue
+                # The other root moves may already have raised the bound of this depth
+                with _shared_alpha.get_lock():
+                    alpha = _shared_alpha[depth]
+                value = player.alphabeta(child, depth, alpha, float("inf"), 1, initial_time)
+                with _shared_alpha.get_lock():
+                    if value > _shared_alpha[depth]:
+                        _shared_alpha[depth] = value
+                # At or below alpha, the search was cut off and the value only bounds the one of the move. Without a
+                # bound yet the window is full, and even a lost move gets its exact value.
+                values[depth] = (value, value > alpha or alpha == float("-inf"))
+                if len(child.legal_moves()) == 0:
+                    # Nothing below this move, deeper iterations would give the same value
+                    results[child.move] = (values, True)
+            if all(final for _, final in results.values()):
+                break
+            depth += 1
+    except TimeoutError:
+        pass
+    return results
+
+
+class RootParallelSearch:
+    """
+    Root-parallel search: the moves of the root are split across a persistent pool of worker processes, and every
+    worker searches its share by iterative deepening. The workers share, for every depth, the best value found so far
+    at the root, and use it as alpha.
+    """
+
+    def __init__(self, n_workers, observation_rows=None):
+        """
+        :param n_workers: number of worker processes
+        :param observation_rows: observations of the whole game, sent once to every worker, or None
+        """
+        self.n_workers = n_workers
+        self.observation_rows = observation_rows
+        self.shared_alpha = mp.Array("d", MAX_PARALLEL_DEPTH)
+        self.pool = mp.Pool(n_workers, initializer=init_worker, initargs=(self.shared_alpha, observation_rows))
+        self.last_depth = 0
+
+    def search(self, node, initial_time, time_limit):
+        """
+        Search the best move of the root
+        :param node: the root node, a MAX node
+        :param initial_time: the time at the beginning of the search
+        :param time_limit: seconds after initial_time at which the result is needed
+        :return: the best move, or None if no depth was completed for every move
+        """
+        children = node.compute_and_get_children()
+        if len(children) == 1:
+            return children[0].move
+        with self.shared_alpha.get_lock():
+            self.shared_alpha[:] = [float("-inf")] * MAX_PARALLEL_DEPTH
+
+        # The workers already have the observations of the whole game, only the step of the root is sent
+        observations = node.observations
+        if isinstance(observations, ObservationSequence) and observations.rows is self.observation_rows:
+            observations = observations.offset
+
+        # One task per worker, each with a share of the root moves, so that no move waits for a free worker
+        tasks = [children[i::self.n_workers] for i in range(min(self.n_workers, len(children)))]
+        pending = [self.pool.apply_async(search_root_moves, ([child.move for child in task],
+                                                             [child.state for child in task],
+                                                             observations, initial_time, time_limit))
+                   for task in tasks]
+        values = {child.move: {} for child in children}
+        final = {child.move: False for child in children}
+        for result in pending:
+            try:
+                for move, (move_values, move_final) in result.get(
+                        timeout=max(initial_time + time_limit - time.time(), 0)).items():
+                    values[move], final[move] = move_values, move_final
+            except mp.TimeoutError:
+                pass
+
+        # Keep the deepest iteration that every root move completed. Moves with a final value complete them all.
+        depth = min((max(values[move], default=0) for move in values if not final[move]), default=MAX_PARALLEL_DEPTH)
+        self.last_depth = depth
+        if depth == 0 or not any(values.values()):
+            return None
+
+        def value_at_depth(move):
+            move_values = values[move]
+            return move_values[depth] if depth in move_values else move_values[max(move_values)]
+
+        # A move that failed low may be much worse than its bound, only the exact values are compared
+        exact = [move for move in values if values[move] and value_at_depth(move)[1]]
+        return max(exact or values, key=lambda move: value_at_depth(move)[0])
+
+    def close(self):
+        """
+        Stop the worker processes
+        :return:
+        """
+        self.pool.terminate()
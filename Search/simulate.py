@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+import argparse
+import json
+
+import yaml
+
+from fishing_game_core.headless import HeadlessFishingDerby, LocalOpponent
+from main import Settings
+
+
+def play_game(settings, seed=None, verbose=False):
+    """
+    Play a headless game of the minimax player against the local opponent
+    :param settings: Settings instance, observations_file must be set
+    :param seed: seed of the game and of the opponent
+    :param verbose: print every move of player 0
+    :return: game record, see HeadlessFishingDerby.play
+    """
+    from player import PlayerControllerMinimax
+
+    game = HeadlessFishingDerby.from_file(settings.observations_file, time_threshold=settings.time_threshold)
+    player_controller = PlayerControllerMinimax()
+    player_controller.load_settings(settings)
+    player_controller.initialize_search(game.first_message())
+
+    def print_move(record):
+        if record["player"] == 0:
+            print(f"Step {record['step']}\tAction: {record['action']}\tDepth: {record['depth']}"
+                  f"\tSearch time: {record['time']:.2E}\tScore: {record['score_p0'] - record['score_p1']}")
+
+    try:
+        return game.play(player_controller, LocalOpponent(seed=seed), seed=seed,
+                         on_move=print_move if verbose else None)
+    finally:
+        if player_controller.book is not None:
+            player_controller.book.save()
+        if player_controller.profiler is not None:
+            player_controller.profiler.close()
+        if player_controller.root_parallel is not None:
+            player_controller.root_parallel.close()
+        if player_controller.mcts is not None:
+            player_controller.mcts.close()
+
+
+if __name__ == '__main__':
+    # Arguments parsing
+    arguments_parser = argparse.ArgumentParser(
+        description="Play the fishing derby KTH game without graphical interface")
+    arguments_parser.add_argument("config_file", type=str,
+                                  help="Configuration file")
+    arguments_parser.add_argument("--seed", type=int, default=120283473,
+                                  help="Seed of the game")
+    arguments_parser.add_argument("--output", type=str, default=None,
+                                  help="Write the record of every move to this JSON file")
+    arguments_parser.add_argument("--quiet", action="store_true",
+                                  help="Only print the final result")
+    args = arguments_parser.parse_args()
+
+    # Load the settings from the yaml file
+    settings = Settings()
+    settings_dictionary = yaml.safe_load(open(args.config_file, 'r'))
+    settings.load_from_dict(settings_dictionary)
+
+    result = play_game(settings, seed=args.seed, verbose=not args.quiet)
+    depths = [move["depth"] for move in result["moves"] if move["player"] == 0]
+    times = [move["time"] for move in result["moves"] if move["player"] == 0]
+    print("Final score:", result["score_p0"] - result["score_p1"],
+          f"\tPlayer 0: {result['score_p0']}\tPlayer 1: {result['score_p1']}")
+    print(f"Moves: {len(depths)}\tMean depth: {sum(depths) / max(len(depths), 1):.2f}"
+          f"\tMax search time: {max(times, default=0):.2E}\tTimeouts: {result['n_timeouts']}"
+          + ("\tTIMED OUT" if result["timed_out"] else ""))
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(result, f)
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The modules of the game and of the player are imported from the Search directory, as main.py does
+SEARCH_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SEARCH_DIR)
+os.chdir(SEARCH_DIR)
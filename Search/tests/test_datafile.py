@@ -0,0 +1,51 @@
+import glob
+import json
+
+import pytest
+
+from fishing_game_core.datafile import (SequencesDatafile, load_binary_sequences, load_json_checked,
+                                        save_binary_sequences, validate_sequences)
+
+
+@pytest.mark.parametrize("filename", sorted(glob.glob("observations/*.json")))
+def test_binary_round_trip(filename, tmp_path):
+    """
+    A scenario written to the binary format must load back with the values json.load gives
+    """
+    data, _ = load_json_checked(filename)
+    binary_file = str(tmp_path / "scenario.obs")
+    save_binary_sequences(data, binary_file)
+
+    datafile = SequencesDatafile()
+    datafile.load(binary_file)
+    loaded = datafile.data
+    assert loaded["init_fishes"] == data["init_fishes"]
+    assert loaded["init_players"] == data["init_players"]
+    assert loaded["params"]["n_seq"] == data["params"]["n_seq"]
+    assert loaded["sequence"].keys() == data["sequence"].keys()
+    for key, observations in data["sequence"].items():
+        assert loaded["sequence"][key].tolist() == observations
+
+
+def test_duplicate_keys_are_reported(tmp_path):
+    """
+    A key that appears twice in the JSON file must be reported, json.load alone keeps the last value silently
+    """
+    filename = tmp_path / "duplicate.json"
+    filename.write_text('{"init_fishes": {"0": {"init_pos": [1, 2], "score": 2}, "0": {"init_pos": [3, 4], "score": 2}},'
+                        ' "init_players": {"0": [0, 0], "1": [5, 0]}, "params": {"n_seq": 2},'
+                        ' "sequence": {"0": [0, 1]}}')
+    data, duplicates = load_json_checked(str(filename))
+    assert duplicates == ["0"]
+    assert data["init_fishes"]["0"]["init_pos"] == [3, 4]
+    assert "duplicate key '0'" in validate_sequences(data, duplicates)
+
+
+def test_not_a_binary_file(tmp_path):
+    """
+    A file without the header of the binary format must be rejected
+    """
+    filename = tmp_path / "scenario.obs"
+    filename.write_bytes(json.dumps({"params": {}}).encode().ljust(64))
+    with pytest.raises(ValueError):
+        load_binary_sequences(str(filename))
@@ -0,0 +1,82 @@
+import random
+
+import pytest
+
+from fishing_game_core.game_tree import FishTrajectories, SearchState
+from fishing_game_core.headless import HeadlessFishingDerby
+from player import PlayerControllerMinimax, QUIESCENCE_PLIES, capture_moves, quiet_evaluation
+
+# Number of positions searched per scenario
+N_POSITIONS = 40
+
+
+def reference_quiescence(state, plies):
+    """
+    Quiescence search without window: the player to move keeps the quiet evaluation or plays any capture
+    :param state: SearchState instance
+    :param plies: number of plies the search may still add
+    :return: the value of the state
+    """
+    value = quiet_evaluation(state)
+    for move in (capture_moves(state) if plies > 0 else []):
+        state.apply(move)
+        child_value = reference_quiescence(state, plies - 1)
+        state.undo()
+        value = max(value, child_value) if state.player == 0 else min(value, child_value)
+    return value
+
+
+def reference_minimax(state, depth):
+    """
+    Full-width minimax with the same leaves as PlayerControllerMinimax.alphabeta_state
+    :param state: SearchState instance
+    :param depth: depth maximum to go down the tree
+    :return: the minimax value of the state
+    """
+    moves = state.legal_moves() if depth > 0 else []
+    if len(moves) == 0:
+        return reference_quiescence(state, QUIESCENCE_PLIES if depth == 0 else 0)
+    values = []
+    for move in moves:
+        state.apply(move)
+        values.append(reference_minimax(state, depth - 1))
+        state.undo()
+    return max(values) if state.player == 0 else min(values)
+
+
+def sample_positions(filename, seed):
+    """
+    Positions of a game played with random moves
+    :param filename: observations file of the scenario
+    :param seed: seed of the moves
+    :return: list of (game, node) tuples
+    """
+    generator = random.Random(seed)
+    game = HeadlessFishingDerby.from_file(filename)
+    state = game.initial_state()
+    positions = []
+    for step in range(game.n_seq - 1):
+        node = game.root(state, step)
+        if step % 7 == 3:
+            positions.append((game, node))
+        moves = node.legal_moves()
+        state = game.advance(state, step, generator.choice(moves) if moves else 0)
+        if len(positions) == N_POSITIONS or all(position is None for position in state.fish):
+            break
+    return positions
+
+
+@pytest.mark.parametrize("filename", ["observations/test_%d.json" % i for i in range(4)])
+def test_alphabeta_matches_minimax(filename):
+    """
+    The pruning of alphabeta_state and of the quiescence search must not change the value of a fixed-depth search
+    """
+    player = PlayerControllerMinimax()
+    player.time_budget = float("inf")
+    for i, (game, node) in enumerate(sample_positions(filename, seed=1)):
+        depth = 2 + i % 3
+        player.transposition_table.clear()
+        player.trajectories = FishTrajectories([node])
+        expected = reference_minimax(SearchState(node, player.trajectories), depth)
+        value = player.alphabeta_state(SearchState(node, player.trajectories), depth, float("-inf"), float("inf"), 0.0)
+        assert value == pytest.approx(expected), f"step {node.depth}, depth {depth}"
@@ -0,0 +1,66 @@
+import random
+
+import pytest
+
+from fishing_game_core.game_tree import FishTrajectories, SearchState, compute_zobrist_key
+from fishing_game_core.headless import HeadlessFishingDerby
+
+# Number of random lines played from every root, and their length
+N_LINES = 20
+LINE_LENGTH = 12
+
+
+def snapshot(state):
+    """
+    Fields of a state compared by the tests
+    :param state: State or SearchState instance
+    :return: tuple
+    """
+    return (state.player, tuple(state.hooks), tuple(state.fish), tuple(state.scores), tuple(state.caught), state.key)
+
+
+def sample_roots(filename, seed):
+    """
+    Roots of the positions reached every few steps of a game played with random moves
+    :param filename: observations file of the scenario
+    :param seed: seed of the moves
+    :return: list of nodes
+    """
+    generator = random.Random(seed)
+    game = HeadlessFishingDerby.from_file(filename)
+    state = game.initial_state()
+    roots = []
+    for step in range(game.n_seq - 1):
+        node = game.root(state, step)
+        if step % 9 == 0:
+            roots.append(node)
+        moves = node.legal_moves()
+        state = game.advance(state, step, generator.choice(moves) if moves else 0)
+    return roots
+
+
+@pytest.mark.parametrize("filename", ["observations/test_%d.json" % i for i in range(4)])
+def test_apply_matches_game_tree(filename):
+    """
+    SearchState.apply must give the states and the Zobrist keys of Node.compute_next_state, the incremental keys must
+    match the keys computed from scratch, and undo must restore every field
+    """
+    generator = random.Random(0)
+    for root in sample_roots(filename, seed=0):
+        state = SearchState(root, FishTrajectories([root]))
+        for _ in range(N_LINES):
+            initial = snapshot(state)
+            node = root
+            for _ in range(LINE_LENGTH):
+                moves = state.legal_moves()
+                assert moves == node.legal_moves()
+                if len(moves) == 0:
+                    break
+                move = generator.choice(moves)
+                state.apply(move)
+                node = node.get_child(move)
+                assert snapshot(state) == snapshot(node.state)
+                assert state.key == compute_zobrist_key(node.state, len(node.observations) - node.depth)
+            while state.undo_stack:
+                state.undo()
+            assert snapshot(state) == initial
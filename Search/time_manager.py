@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+import time
+
+# Seconds kept between the end of the search and the time threshold, for the answer and the scheduling jitter
+SAFETY_MARGIN = 10e-3
+# Shortest budget given to a search, even when the measured latency leaves less
+MIN_BUDGET = 5e-3
+# Number of latency measurements the round-trip estimate is taken from
+LATENCY_WINDOW = 16
+# The clock is only read every CLOCK_CHECK_INTERVAL nodes, a power of two so that the test is a mask
+CLOCK_CHECK_INTERVAL = 64
+CLOCK_CHECK_MASK = CLOCK_CHECK_INTERVAL - 1
+# Bounds of the effective branching factor used to predict the duration of the next depth
+MIN_BRANCHING_FACTOR = 1.0
+MAX_BRANCHING_FACTOR = 5.0
+
+
+class TimeManager:
+    """
+    Time budget of the searches of a player. The game measures the time between sending a message and receiving the
+    answer, which includes the pipe in both directions, so the budget is the time threshold minus the round trip
+    measured on the previous messages and a safety margin. The game stamps every message with the time it was sent:
+    the trip of the message to the player is measured, and the trip of the answer, which is much smaller, is assumed
+    to take as long.
+    """
+
+    def __init__(self, time_threshold=75e-3, safety_margin=SAFETY_MARGIN):
+        """
+        :param time_threshold: seconds the game gives to answer, see settings.time_threshold
+        :param safety_margin: seconds kept unused at the end of every turn
+        """
+        self.time_threshold = time_threshold
+        self.safety_margin = safety_margin
+        # Last one-way latencies, the round trip is estimated from the slowest of them
+        self.latencies = []
+        # Time the message of the current turn was received
+        self.turn_start = None
+
+    @property
+    def round_trip(self):
+        """
+        Estimated round trip of a message and its answer
+        :return: seconds
+        """
+        return 2 * max(self.latencies, default=0.0)
+
+    def start_turn(self, msg, received_time=None):
+        """
+        Record the latency of the message of a new turn
+        :param msg: message received from the game
+        :param received_time: time the message was received, now by default
+        :return:
+        """
+        if received_time is None:
+            received_time = time.time()
+        self.turn_start = received_time
+        if "time_sent" in msg:
+            self.latencies.append(max(received_time - msg["time_sent"], 0.0))
+            del self.latencies[:-LATENCY_WINDOW]
+
+    def budget(self, initial_time):
+        """
+        Seconds a search starting now may use
+        :param initial_time: the time at the beginning of the search
+        :return: seconds after initial_time at which the search must stop
+        """
+        budget = self.time_threshold - self.safety_margin - self.round_trip
+        if self.turn_start is not None:
+            # Time already spent on the turn before the search, e.g. building the root node
+            budget -= max(initial_time - self.turn_start, 0.0)
+            self.turn_start = None
+        return max(budget, MIN_BUDGET)
+
+    @staticmethod
+    def should_deepen(elapsed, budget, iteration_time, iteration_nodes, previous_nodes):
+        """
+        Predict whether the next depth of an iterative deepening search finishes within the budget. The next depth is
+        assumed to take as many times longer than the last one as the last one searched more nodes than the one
+        before, i.e. the effective branching factor.
+        :param elapsed: seconds since the beginning of the search
+        :param budget: seconds the search may use
+        :param iteration_time: seconds taken by the last completed depth
+        :param iteration_nodes: nodes searched by the last completed depth
+        :param previous_nodes: nodes searched by the depth before, or 0 if there is none
+        :return: bool
+        """
+        if previous_nodes == 0:
+            return elapsed < budget
+        branching_factor = min(max(iteration_nodes / previous_nodes, MIN_BRANCHING_FACTOR), MAX_BRANCHING_FACTOR)
+        return elapsed + iteration_time * branching_factor < budget
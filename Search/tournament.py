@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+import argparse
+import copy
+import glob
+import json
+import multiprocessing as mp
+import os
+
+import yaml
+
+from main import Settings
+from simulate import play_game
+
+# Extensions of the scenario files played, see convert_observations.py for the binary ones
+SCENARIO_PATTERNS = ("*.json", "*.obs")
+
+
+def play_match(arguments):
+    """
+    Play one game of a tournament, in a worker process
+    :param arguments: 3-tuple (settings, observations file, seed)
+    :return: dict with the summary of the game
+    """
+    settings, observations_file, seed = arguments
+    settings = copy.copy(settings)
+    settings.observations_file = observations_file
+    result = play_game(settings, seed=seed)
+    moves = [move for move in result["moves"] if move["player"] == 0]
+    return {"file": observations_file, "seed": seed, "score_p0": result["score_p0"], "score_p1": result["score_p1"],
+            "n_timeouts": result["n_timeouts"], "timed_out": result["timed_out"],
+            "mean_depth": sum(move["depth"] for move in moves) / max(len(moves), 1),
+            "max_time": max((move["time"] for move in moves), default=0.0)}
+
+
+def aggregate(games):
+    """
+    Statistics of a set of games. A game lost on time, i.e. after 3 timeouts in a row as in
+    FishingDerbyMinimaxApp.check_time_threshold, counts as a loss whatever the score.
+    :param games: non-empty list of game summaries, see play_match
+    :return: dict
+    """
+    wins = sum(game["score_p0"] > game["score_p1"] and not game["timed_out"] for game in games)
+    losses = sum(game["score_p0"] < game["score_p1"] or game["timed_out"] for game in games)
+    return {"games": len(games), "wins": wins, "draws": len(games) - wins - losses, "losses": losses,
+            "win_rate": wins / len(games),
+            "mean_score_difference": sum(game["score_p0"] - game["score_p1"] for game in games) / len(games),
+            "timeouts": sum(game["n_timeouts"] for game in games),
+            "games_lost_on_time": sum(game["timed_out"] for game in games),
+            "mean_depth": sum(game["mean_depth"] for game in games) / len(games),
+            "max_time": max(game["max_time"] for game in games)}
+
+
+def print_statistics(name, statistics):
+    """
+    Print the statistics of a set of games on one line
+    :param name: name of the set
+    :param statistics: dict, see aggregate
+    :return:
+    """
+    print(f"{name:<24}games {statistics['games']:>4}  win rate {statistics['win_rate']:>6.1%}"
+          f"  W/D/L {statistics['wins']}/{statistics['draws']}/{statistics['losses']}"
+          f"  score diff {statistics['mean_score_difference']:>+6.2f}  timeouts {statistics['timeouts']:>3}"
+          f"  lost on time {statistics['games_lost_on_time']:>2}  depth {statistics['mean_depth']:>5.2f}"
+          f"  max time {statistics['max_time']:.2E}")
+
+
+if __name__ == '__main__':
+    # Arguments parsing
+    arguments_parser = argparse.ArgumentParser(
+        description="Play the minimax player against the local opponent on every scenario of a directory")
+    arguments_parser.add_argument("config_file", type=str,
+                                  help="Configuration file of the player, its observations_file is ignored")
+    arguments_parser.add_argument("--scenarios", type=str, default="observations",
+                                  help="Directory of the scenario files")
+    arguments_parser.add_argument("--seeds", type=int, default=8,
+                                  help="Number of seeds every scenario is played with")
+    arguments_parser.add_argument("--first-seed", type=int, default=1,
+                                  help="First seed, the next ones follow")
+    arguments_parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                                  help="Number of games played at the same time. The searches are timed, so more "
+                                       "workers than cores makes them shallower and may cause timeouts")
+    arguments_parser.add_argument("--output", type=str, default=None,
+                                  help="Write the summary of every game and the statistics to this JSON file")
+    args = arguments_parser.parse_args()
+
+    # Load the settings from the yaml file
+    settings = Settings()
+    settings_dictionary = yaml.safe_load(open(args.config_file, 'r'))
+    settings.load_from_dict(settings_dictionary)
+    # The games already run in parallel, and the processes of the pool cannot start their own workers
+    settings.search_workers = 0
+    # The book would be written by several games at the same time
+    settings.position_book = None
+
+    files = sorted(filename for pattern in SCENARIO_PATTERNS
+                   for filename in glob.glob(os.path.join(args.scenarios, pattern)))
+    if not files:
+        arguments_parser.error(f"no scenario file in {args.scenarios}")
+    seeds = range(args.first_seed, args.first_seed + args.seeds)
+    matches = [(settings, filename, seed) for filename in files for seed in seeds]
+
+    with mp.Pool(min(args.workers, len(matches))) as pool:
+        games = []
+        for game in pool.imap_unordered(play_match, matches):
+            games.append(game)
+            print(f"{game['file']}\tseed {game['seed']}\tscore {game['score_p0'] - game['score_p1']:+d}"
+                  f"\ttimeouts {game['n_timeouts']}" + ("\tTIMED OUT" if game["timed_out"] else ""))
+    games.sort(key=lambda game: (game["file"], game["seed"]))
+
+    print()
+    statistics = {filename: aggregate([game for game in games if game["file"] == filename]) for filename in files}
+    for filename in files:
+        print_statistics(os.path.basename(filename), statistics[filename])
+    statistics["all"] = aggregate(games)
+    print_statistics("all", statistics["all"])
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump({"games": games, "statistics": statistics}, f, indent=2)
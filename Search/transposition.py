@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+# Bound types of the values stored in the transposition table
+EXACT = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+
+
+class TranspositionTable:
+    """
+    Fixed-capacity transposition table indexed by the Zobrist key of the nodes.
+    Every slot holds a single entry (key, depth, value, flag, move, generation). A slot is overwritten when it is
+    empty, when its entry was stored during a previous search or when the new entry was searched at least as deep.
+    The table is meant to live as long as the player, so that every turn can reuse the previous searches.
+    """
+
+    def __init__(self, capacity=2 ** 18):
+        """
+        :param capacity: number of slots, rounded up to a power of two
+        """
+        size = 1
+        while size < capacity:
+            size *= 2
+        self.mask = size - 1
+        self.entries = [None] * size
+        self.generation = 0
+        self.probes = 0
+        self.hits = 0
+
+    def new_search(self):
+        """
+        Mark the beginning of a new search. Entries of previous searches are kept but can be replaced freely.
+        :return:
+        """
+        self.generation += 1
+
+    def probe(self, key):
+        """
+        Look up the entry of a key
+        :param key: Zobrist key of the node
+        :return: (key, depth, value, flag, move, generation) tuple or None if the key is not stored
+        """
+        self.probes += 1
+        entry = self.entries[key & self.mask]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        return None
+
+    def store(self, key, depth, value, flag, move):
+        """
+        Store the result of a search, following the depth-preferred replacement policy
+        :param key: Zobrist key of the node
+        :param depth: remaining depth the node was searched with
+        :param value: minimax value or bound found for the node
+        :param flag: one of EXACT, LOWER_BOUND or UPPER_BOUND
+        :param move: best move found at the node, None for leaves
+        :return:
+        """
+        index = key & self.mask
+        entry = self.entries[index]
+        if entry is None or entry[5] != self.generation or depth >= entry[1]:
+            self.entries[index] = (key, depth, value, flag, move, self.generation)
+
+    def clear(self):
+        """
+        Remove every entry of the table
+        :return:
+        """
+        self.entries = [None] * (self.mask + 1)
+        self.probes = 0
+        self.hits = 0